@@ -1,16 +1,27 @@
 import streamlit as st
-import pdfplumber
-import google.generativeai as genai
-import tempfile
-import re
 import os
-import json
 import base64
+import math
 import time  
+import secrets
+import functools
 from pathlib import Path
 from dotenv import load_dotenv
-from fpdf import FPDF
-import io
+from collections.abc import Mapping
+import metrics
+from submission_store import SubmissionStore
+from pdf_extract import PDF_MEMORY_LIMIT_MB, PDF_STREAMING, PDF_WORKERS, spool_upload
+from question_bank import QuestionBank, student_seed
+from storage import DEFAULT_EXAM, STORAGE_URL, ExamStore, check_exam_id, open_backend
+from dedup_index import DEDUP_THRESHOLD
+from grading import answer_label, build_key, key_index, mark, pack, regrade_all
+from item_stats import ItemStats
+from jobs import ACTIVE_STATUSES, JOB_DIR, JobQueue
+from publishing import UPLOAD_DIR, run_generation_job, run_import_job
+from exports import answer_key_txt, results_csv, results_pdf, results_pdf_format, student_reports_zip
+from question_gen import (
+    LLM_CACHE_ENABLED, MAX_CONCURRENCY, FakeClient, GeminiClient
+)
 
 # --- CONFIG & PERSISTENCE ---
 load_dotenv()
@@ -20,76 +31,111 @@ if not api_key:
     st.error("Missing Gemini API Key. Please configure it in your Secrets or .env file.")
     st.stop()
 
-genai.configure(api_key=api_key)
-
 st.set_page_config(page_title="ABAP on HANA Assessment - Smart Exam", layout="centered")
+render_started = time.perf_counter()
+
+DATA_DIR = os.getenv("BODHA_DATA_DIR", ".")
+DB_FILE = os.path.join(DATA_DIR, "global_quiz_data.json")  # legacy single exam, migrated into EXAMS_DB
+RESULTS_FILE = os.path.join(DATA_DIR, "student_submissions.json")  # legacy format, migrated into RESULTS_DB
+RESULTS_DB = os.path.join(DATA_DIR, "student_submissions.db")
+BANK_DB = os.path.join(DATA_DIR, "question_bank.db")
+# Used unless BODHA_STORAGE_URL points at another backend, e.g. redis://.
+EXAMS_DB = os.path.join(DATA_DIR, "exams.db")
+NEW_EXAM_OPTION = "➕ New exam..."
+EXAM_PAGE_SIZE = int(os.getenv("BODHA_EXAM_PAGE_SIZE", "10"))
+JOBS_DB = os.path.join(JOB_DIR, "jobs.db")
+JOB_POLL_SECONDS = 2
+
+@st.cache_resource
+def get_exam_store():
+    # Shared, read-only snapshots per exam, reloaded only when a publish is announced.
+    store = ExamStore(open_backend(STORAGE_URL or EXAMS_DB))
+    store.migrate_json(DB_FILE)
+    return store
+
+@st.cache_resource
+def get_submission_store():
+    store = SubmissionStore(RESULTS_DB)
+    store.migrate_json(RESULTS_FILE)
+    return store
+
+@st.cache_resource
+def get_question_bank():
+    return QuestionBank(BANK_DB)
+
+def is_bank_exam(exam):
+    return isinstance(exam, Mapping) and exam.get("mode") == "bank"
+
+def assemble_student_quiz(exam, name):
+    # Randomized exams give every student their own reproducible paper.
+    if not is_bank_exam(exam):
+        return exam
+    if not name.strip():
+        return []
+    paper_key = (exam["seed"], " ".join(name.lower().split()))
+    if st.session_state.get("paper_key") != paper_key:
+        st.session_state.paper = get_question_bank().sample_exam(
+            student_seed(exam["seed"], name), exam["count"],
+            topic=exam.get("topic"), difficulty=exam.get("difficulty"), q_type=exam.get("q_type"),
+            # Exams published with a frozen pool keep drawing the same papers as the bank grows.
+            pool=exam.get("pool")
+        )
+        st.session_state.paper_key = paper_key
+    return st.session_state.paper
 
-DB_FILE = "global_quiz_data.json"
-RESULTS_FILE = "student_submissions.json"
-
-def save_quiz_to_disk(data):
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f)
-
-def load_quiz_from_disk():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r") as f:
-            try: return json.load(f)
-            except: return []
-    return []
-
-def save_student_score(name, score, total):
-    results = load_all_results()
-    results.append({
-        "Student Name": name,
-        "Score": f"{score}/{total}",
-        "Percentage": f"{(score/total)*100:.1f}%",
-        "Timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-    with open(RESULTS_FILE, "w") as f:
-        json.dump(results, f)
-
-def load_all_results():
-    if os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, "r") as f:
-            try: return json.load(f)
-            except: return []
-    return []
-# --- ADD THIS HELPER FUNCTION BELOW load_all_results() ---
-def create_pdf_report(results_data):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(190, 10, "Student Assessment Submissions", ln=True, align="C")
-    pdf.ln(10)
-
-# Table Header
-    pdf.set_font("Arial", "B", 10)
-    pdf.set_fill_color(200, 220, 255)
-    pdf.cell(50, 10, "Student Name", 1, 0, 'C', True)
-    pdf.cell(30, 10, "Score", 1, 0, 'C', True)
-    pdf.cell(30, 10, "Percentage", 1, 0, 'C', True)
-    pdf.cell(80, 10, "Timestamp", 1, 1, 'C', True)
-    
-    # Table Body
-    pdf.set_font("Arial", "", 10)
-    for res in results_data:
-        pdf.cell(50, 10, str(res["Student Name"]), 1)
-        pdf.cell(30, 10, str(res["Score"]), 1, 0, 'C')
-        pdf.cell(30, 10, str(res["Percentage"]), 1, 0, 'C')
-        pdf.cell(80, 10, str(res["Timestamp"]), 1, 1, 'C')
-    
-    # Return as bytes
-    return pdf.output(dest='S').encode('latin-1')
-    
+def save_student_score(name, score, total, question_ids=None, answers=None, exam_id=DEFAULT_EXAM, exam_version=None):
+    # Storing the answer vector lets the submission be re-graded after a key fix.
+    if question_ids is not None:
+        question_ids, answers = pack(question_ids, answers)
+    else:
+        answers = None
+    get_submission_store().append(
+        name, score, total, question_ids=question_ids, answers=answers, exam_id=exam_id, exam_version=exam_version
+    )
+
+def exam_question_ids(exam, add_missing=True):
+    # Published questions carry their bank id; exams published before that are looked up,
+    # and with add_missing=False questions the bank lacks come back as None.
+    if all('id' in item for item in exam):
+        return [item['id'] for item in exam]
+    if not add_missing:
+        return get_question_bank().find_ids(list(exam))
+    return get_question_bank().ids_for(list(exam))
+
+FIX_SEARCH_LIMIT = 50
+
+def find_pool_questions(query, pool_ids, limit=FIX_SEARCH_LIMIT):
+    # A bank id, or words from the stem; only questions in the exam's pool are offered.
+    pool = set(pool_ids)
+    ids = [int(query)] if query.isdigit() and int(query) in pool else []
+    ids += [qid for qid in get_question_bank().search(query, within=pool, limit=limit) if qid not in ids]
+    return get_question_bank().get_questions(ids[:limit])
+
+def load_all_results(exam_id):
+    return get_submission_store().results(exam_id)
+
+@st.cache_resource
+def get_item_stats(exam_id):
+    # One per exam, shared by every session; each rerun only folds in the new submissions.
+    return ItemStats(exam_id)
 # --- UI STYLING ---
-def set_background(image_file):
-    try:
-        encoded = base64.b64encode(open(image_file, "rb").read()).decode()
-        css = f"""
+STATIC_DIR = Path(__file__).parent / "static"
+
+
+@st.cache_resource
+def background_css(image_file):
+    # Built once per process. With static serving on, the browser fetches and
+    # caches the image itself; otherwise it is inlined, but encoded only once.
+    static_file = STATIC_DIR / image_file
+    if st.get_option("server.enableStaticServing") and static_file.exists():
+        url = f"app/static/{image_file}"
+    else:
+        source = static_file if static_file.exists() else Path(image_file)
+        url = "data:image/png;base64," + base64.b64encode(source.read_bytes()).decode()
+    return f"""
         <style>
         .stApp {{
-            background-image: url("data:image/png;base64,{encoded}");
+            background-image: url("{url}");
             background-size: cover;
             background-repeat: no-repeat;
             background-position: center center;
@@ -145,23 +191,27 @@ def set_background(image_file):
         }}
 
 /* Timer Styling */
-.timer-container {
+.timer-container {{
     background-color: #f0f2f6;
     padding: 10px;
     border-radius: 10px;
     border-left: 5px solid #1E3A8A;
     text-align: center;
     margin-bottom: 20px;
-}
-.timer-text {
+}}
+.timer-text {{
     font-size: 24px;
     font-weight: bold;
     color: #1E3A8A;
-}
+}}
         </style>
         """
-        st.markdown(css, unsafe_allow_html=True)
-    except:
+
+
+def set_background(image_file):
+    try:
+        st.markdown(background_css(image_file), unsafe_allow_html=True)
+    except OSError:
         pass
 
 set_background("BodhaImage.png")
@@ -169,89 +219,108 @@ set_background("BodhaImage.png")
 # --- SESSION STATE ---
 if 'role' not in st.session_state: st.session_state.role = "Student"
 if 'is_authenticated' not in st.session_state: st.session_state.is_authenticated = False
-if 'exam_submitted' not in st.session_state: st.session_state.exam_submitted = False
+# Per exam id, so submitting one exam does not lock or time out another.
+if 'submitted_exams' not in st.session_state: st.session_state.submitted_exams = {}
+if 'start_times' not in st.session_state: st.session_state.start_times = {}
 
 # --- UTILS ---
-def clean_text(text):
-    return re.sub(r'\n+', '\n', text).strip()
-
-@st.cache_data(show_spinner="Processing PDF...")
-def extract_chapters_from_pdf(file_path):
-    full_text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text: full_text += page_text + "\n"
-    return clean_text(full_text)
-
-def parse_generated_questions(raw_text, q_type):
-    questions = []
-    # Improved regex to catch Q:, 1., Question: etc.
-    blocks = re.split(r'\n(?=(?:Q|Question|\d+)\s*[:\).])', raw_text)
-    
-    for block in blocks:
-        # Check if block contains an answer indicator
-        if not re.search(r'(Answer|CORRECT):', block, re.IGNORECASE):
-            continue
-        
-        lines = [l.strip() for l in block.split('\n') if l.strip()]
-        if len(lines) < 2: continue
-        
-        q_text = ""
-        opts = []
-        ans = ""
-        
-        for line in lines:
-            # Match Question
-            if re.match(r'^(?:Q|Question|\d+)\s*[:\).]', line, re.IGNORECASE):
-                q_text = re.sub(r'^(?:Q|Question|\d+)\s*[:\).]', '', line).strip()
-            # Match Options A) B) C) D) or A. B. C. D.
-            elif re.match(r'^[A-D][\)\.\s]', line, re.IGNORECASE):
-                opts.append(line)
-            # Match Answer
-            elif re.search(r'(Answer|CORRECT):', line, re.IGNORECASE):
-                ans = line.split(":")[-1].strip().upper()
-        
-        if not opts and q_type == "True/False":
-            opts = ["True", "False"]
-        
-        # Validation: Only add if we have a question and at least 2 options (or T/F)
-        if q_text and (len(opts) >= 2):
-            questions.append({"question": q_text, "options": opts, "answer": ans})
-            
-    return questions
+@st.cache_resource
+def get_model_client():
+    # BODHA_FAKE_LLM=1 runs the whole generation path offline.
+    if os.getenv("BODHA_FAKE_LLM") == "1":
+        return FakeClient()
+    return GeminiClient(api_key=api_key)
+
+@st.cache_resource
+def get_job_queue():
+    bank = get_question_bank()
+    return JobQueue(JOBS_DB, {
+        "generate": functools.partial(run_generation_job, client=get_model_client(), bank=bank, exams=get_exam_store()),
+        "import": functools.partial(run_import_job, bank=bank, exams=get_exam_store()),
+    })
 
-# @st.cache_data(show_spinner="AI is generating questions...")
-def generate_questions(text, difficulty, num, q_type):
-    if not text.strip(): return "ERROR: PDF is empty."
-    
-    # Use the stable model name
-    model = genai.GenerativeModel("gemini-2.5-flash") 
-    
-    # Updated prompt to enforce the number of questions strictly
-    prompt = f"""You are an expert examiner. Generate EXACTLY {num} {difficulty} level {q_type} questions based on the text below.
-    
-    STRICT RULES:
-    1. You must output exactly {num} questions.
-    2. Use this format for every single question:
-       Q: [Question text]
-       A) [Option]
-       B) [Option]
-       C) [Option]
-       D) [Option]
-       Answer: [Correct Letter Only]
-
-    TEXT:
-    {text[:15000]}""" # Increased text limit slightly
-    
-    try:
-        response = model.generate_content(prompt)
-        if response.text:
-            return response.text
+def show_job(job):
+    label = "AI generation" if job.kind == "generate" else "Table import"
+    title = f"{label} · {job.params.get('exam_id', DEFAULT_EXAM)} · {job.params['file_name']} · {job.created_at}"
+    result = job.result or {}
+    if job.status in ACTIVE_STATUSES:
+        st.write(f"⏳ **{title}**")
+        if job.status == "queued":
+            st.caption("Waiting for a free worker...")
+        elif job.total:
+            st.progress(min(job.done / job.total, 1.0), text=f"{job.done} of {job.total} questions")
+        if st.button("Cancel", key=f"cancel_job_{job.id}"):
+            get_job_queue().cancel(job.id)
+            st.rerun()
+    elif job.status == "done":
+        if result.get('published'):
+            st.success(f"✅ {title}: {result['published']} questions published successfully.")
         else:
-            return "ERROR: AI returned empty response."
-    except Exception as e:
-        return f"ERROR: {str(e)}"
+            st.warning(f"⚠️ {title}: no questions were published.")
+        if job.kind == "import":
+            st.info(
+                f"📚 {result['imported']} questions read, "
+                f"{result.get('added_to_bank', 0)} new to the question bank ({get_question_bank().count()} total)."
+            )
+            if result['errors']:
+                with st.expander(f"⚠️ {len(result['errors'])} rows skipped during import"):
+                    st.table(result['errors'])
+        for err in result.get('errors', []) if job.kind == "generate" else []:
+            st.error(f"AI Error: {err}")
+        if result.get('cache'):
+            st.caption(f"AI response cache: {result['cache']['hits']} hits, {result['cache']['misses']} misses since start-up.")
+    elif job.status == "failed":
+        st.error(f"❌ {title}: {job.error}")
+    else:
+        st.caption(f"🚫 {title}: cancelled.")
+
+def record_render_time():
+    metrics.observe_time(f"render_{st.session_state.role.lower()}", time.perf_counter() - render_started)
+
+def metrics_panel():
+    rows = []
+    for m in metrics.get_registry().snapshot():
+        if m['kind'] == metrics.COUNTER:
+            rows.append({"Metric": m['name'], "Count": m['count'], "Total": m['total'], "p50": None, "p95": None, "Last": None})
+            continue
+        # Timers are shown in milliseconds; other values as recorded.
+        scale, unit = (1000, " ms") if m['kind'] == metrics.TIMER else (1, "")
+        rows.append({
+            "Metric": m['name'] + unit, "Count": m['count'], "Total": None,
+            "p50": round(m['p50'] * scale, 2), "p95": round(m['p95'] * scale, 2), "Last": round(m['last'] * scale, 2),
+        })
+    if not rows:
+        st.caption("Nothing measured yet in this server process.")
+        return
+    st.caption("Recent p50/p95 per stage for this server process.")
+    st.dataframe(rows, hide_index=True)
+    st.download_button(
+        label="Download Prometheus Metrics",
+        data=metrics.get_registry().prometheus_text(),
+        file_name="metrics.prom",
+        mime="text/plain"
+    )
+
+def job_status_panel():
+    job_queue = get_job_queue()
+    # Only poll while something is running; a finished job reruns the whole page once.
+    @st.fragment(run_every=JOB_POLL_SECONDS if job_queue.has_active() else None)
+    def panel():
+        jobs = job_queue.recent(3)
+        active = {job.id for job in jobs if job.status in ACTIVE_STATUSES}
+        finished = st.session_state.get('watched_jobs', set()) - active
+        st.session_state.watched_jobs = active
+        if finished:
+            st.rerun()
+        if jobs:
+            st.write("#### 🧵 Publishing Jobs")
+            show_job(jobs[0])
+            if len(jobs) > 1:
+                with st.expander("Earlier jobs"):
+                    for job in jobs[1:]:
+                        show_job(job)
+    panel()
+
 # --- UI LAYOUT ---
 st.markdown("<h1 style='text-align: center; color: #1E3A8A;'>ABAP on HANA Assessment</h1>", unsafe_allow_html=True)
 st.sidebar.title("Navigation")
@@ -276,10 +345,24 @@ if st.session_state.role == "Examiner":
         if st.sidebar.button("🔄 Clear All Data"):
             for f in [DB_FILE, RESULTS_FILE]:
                 if os.path.exists(f): os.remove(f)
+            get_exam_store().clear()
+            get_submission_store().clear()
             st.cache_data.clear()
             st.success("System reset successfully.")
             st.rerun()
 
+        # --- EXAM SELECTION ---
+        # Every publish adds a new version of the selected exam; earlier versions stay as they were.
+        exam_ids = get_exam_store().exam_ids() or [DEFAULT_EXAM]
+        exam_choice = st.selectbox("Exam", exam_ids + [NEW_EXAM_OPTION], help="Students choose between all published exams.")
+        exam_id = st.text_input("New Exam ID", placeholder="e.g. cds-views-basics").strip() if exam_choice == NEW_EXAM_OPTION else exam_choice
+        try:
+            check_exam_id(exam_id)
+        except ValueError as e:
+            if exam_id:
+                st.error(str(e))
+            exam_id = None
+
         # New Radio Button for Generation Mode
         gen_mode = st.radio("Generation Mode", ["Generate Questions", "Generate Question as Is"], horizontal=True)
 
@@ -290,154 +373,278 @@ if st.session_state.role == "Examiner":
             diff = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"])
         with col2:
             num_q = st.slider("Number of Questions", 1, 50, 5)
+            topic = st.text_input("Focus Topic (optional)", placeholder="e.g. CDS Views")
 
-        # --- FIXED GENERATION LOGIC WITH SUCCESS MESSAGE ---
-        if uploaded_file and st.button("Publish Exam"):
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                tmp.write(uploaded_file.read())
-                temp_path = tmp.name
-
-            final_quiz = []
-            seen_questions = set()
+        with st.expander("⚙️ Advanced Settings"):
+            pdf_workers = st.number_input(
+                "PDF extraction workers", min_value=1, max_value=32, value=min(PDF_WORKERS, 32),
+                help="Large PDFs are split across this many processes. 1 extracts pages one at a time."
+            )
+            page_col1, page_col2 = st.columns(2)
+            with page_col1:
+                first_page = st.number_input("First page", min_value=1, value=1, help="Page range used when generating questions.")
+            with page_col2:
+                last_page = st.number_input("Last page", min_value=0, value=0, help="0 reads to the end of the document.")
+            stream_pdf = st.checkbox(
+                "Low-memory extraction", value=PDF_STREAMING,
+                help="Reads the PDF one page at a time in a single process and indexes pages as they arrive. "
+                     "Slower, but memory stays flat for very large manuals."
+            )
+            pdf_memory_mb = st.number_input(
+                "Extraction memory ceiling (MB)", min_value=0, max_value=8192, value=PDF_MEMORY_LIMIT_MB, step=64,
+                help="Parser caches are dropped whenever reading a PDF grows memory by more than this. 0 disables it."
+            )
+            llm_concurrency = st.number_input(
+                "Concurrent AI requests", min_value=1, max_value=16, value=MAX_CONCURRENCY,
+                help="Question batches requested from the model at the same time."
+            )
+            use_llm_cache = st.checkbox(
+                "Reuse cached AI responses", value=LLM_CACHE_ENABLED,
+                help="Publishing again with identical settings answers from the on-disk cache."
+            )
+            fresh_llm = st.checkbox("Force fresh AI responses", value=False, disabled=not use_llm_cache)
+            dedup_threshold = st.slider(
+                "Duplicate similarity threshold", min_value=0.5, max_value=1.0, value=DEDUP_THRESHOLD, step=0.05,
+                help="Questions at least this similar to one already in the exam are dropped as duplicates."
+            )
 
-            # 1. Initialize placeholders globally within this button click to avoid NameError
-            status_placeholder = st.empty() 
-            progress_bar = st.progress(0)
-            
+        # --- PUBLISH AS A BACKGROUND JOB ---
+        # The job keeps running if the examiner navigates away; its status is polled below.
+        if uploaded_file and exam_id and st.button("Publish Exam"):
+            params = {
+                "file_path": spool_upload(uploaded_file, directory=UPLOAD_DIR),
+                "file_name": uploaded_file.name,
+                "exam_id": exam_id,
+                "topic": topic.strip(),
+                "difficulty": diff,
+                "q_type": q_type,
+                "num_q": num_q,
+                "pdf_workers": int(pdf_workers),
+                "dedup_threshold": dedup_threshold,
+            }
             if gen_mode == "Generate Question as Is":
-                with pdfplumber.open(temp_path) as pdf:
-                    first_page_table = pdf.pages[0].extract_table()
-                    
-                    if first_page_table and "Questions" in str(first_page_table[0]):
-                        status_msg = st.info("Reading PDF and validating headers...")
-                        for page in pdf.pages:
-                            table_data = page.extract_table()
-                            if not table_data: continue
-                            
-                            start_idx = 1 if "Questions" in str(table_data[0]) else 0
-                            
-                            for row in table_data[start_idx:]:
-                                if len(row) >= 6 and row[0]:
-                                    q_text = str(row[0]).strip()
-                                    if q_text not in seen_questions:
-                                        final_quiz.append({
-                                            "question": q_text,
-                                            "options": [f"A) {row[1]}", f"B) {row[2]}", f"C) {row[3]}", f"D) {row[4]}"],
-                                            "answer": str(row[5]).strip().upper()
-                                        })
-                                        seen_questions.add(q_text)
-                        status_msg.empty()
-                    else:
-                        st.error("❌ Header Validation Failed: First page must contain 'Questions' header.")
-            
+                get_job_queue().submit("import", params)
             else:
-                # Optimized AI Generation
-                full_text = extract_chapters_from_pdf(temp_path)
-                total_needed = num_q
-                batch_size = 15  
-                
-                # FIX: Initialize status_text BEFORE the while loop
-                status_text = st.empty() 
-                progress_bar = st.progress(0)
-                
-                with st.spinner("AI is generating questions. This may take a minute for 50 questions..."):
-                    while len(final_quiz) < total_needed:
-                        current_batch = min(batch_size, total_needed - len(final_quiz))
-                        
-                        # Now status_text is guaranteed to exist
-                        status_placeholder.write(f"⏳ Generated **{len(final_quiz)}** of **{total_needed}** questions...")
-                        
-                        raw_output = generate_questions(full_text, diff, current_batch, q_type)
-                        
-                        if "ERROR" not in raw_output:
-                            batch_data = parse_generated_questions(raw_output, q_type)
-                            for item in batch_data:
-                                if item['question'] not in seen_questions:
-                                    final_quiz.append(item)
-                                    seen_questions.add(item['question'])
-                            
-                            prog = min(len(final_quiz) / total_needed, 1.0)
-                            progress_bar.progress(prog)
-                        else:
-                            st.error(f"AI Error: {raw_output}")
-                            break
-                            
-                # Cleanup the status text after loop finishes
-                time.sleep(1)
-                status_placeholder.empty() # Safely clears the status text
-
-            if final_quiz:
-                # Save data
-                save_quiz_to_disk(final_quiz[:num_q] if gen_mode == "Generate Questions" else final_quiz)
-                
-                # --- THE FIX: PERSISTENT MESSAGE ---
-                st.success(f"✅ Question paper generated! {len(final_quiz)} questions published successfully.")
-                st.toast("Exam Published!", icon="🚀")
-                
-                # Give the user 2 seconds to see the message before rerunning
-                time.sleep(2) 
-                st.rerun()
+                params.update(
+                    llm_concurrency=int(llm_concurrency), use_cache=use_llm_cache, fresh=fresh_llm,
+                    page_start=int(first_page) - 1, page_stop=int(last_page) or None,
+                    stream_pdf=stream_pdf, pdf_memory_mb=int(pdf_memory_mb),
+                )
+                get_job_queue().submit("generate", params)
+            st.toast("Publishing started in the background.", icon="⏳")
+
+        job_status_panel()
+        # --- RANDOMIZED EXAM FROM QUESTION BANK ---
+        bank = get_question_bank()
+        if bank.count():
+            with st.expander(f"🎲 Randomized Exam from Question Bank ({bank.count()} questions)"):
+                bcol1, bcol2 = st.columns(2)
+                with bcol1:
+                    bank_topic = st.selectbox("Bank Topic", ["All"] + bank.facet_values("topic"))
+                    bank_diff = st.selectbox("Bank Difficulty", ["All"] + bank.facet_values("difficulty"))
+                with bcol2:
+                    bank_type = st.selectbox("Bank Type", ["All"] + bank.facet_values("q_type"))
+                    bank_filters = {
+                        "topic": None if bank_topic == "All" else bank_topic,
+                        "difficulty": None if bank_diff == "All" else bank_diff,
+                        "q_type": None if bank_type == "All" else bank_type,
+                    }
+                    pool_size = len(bank.question_ids(**bank_filters))
+                    bank_count = st.number_input(
+                        "Questions per Student", min_value=1, max_value=max(pool_size, 1), value=min(num_q, max(pool_size, 1))
+                    )
+                st.caption(f"{pool_size} matching questions. Each student gets their own reproducible selection.")
+                if pool_size and exam_id and st.button("Publish Randomized Exam"):
+                    get_exam_store().publish(exam_id, {
+                        "mode": "bank", "count": int(bank_count), "seed": secrets.token_hex(8), **bank_filters,
+                        "pool": list(bank.question_ids(**bank_filters)),
+                    })
+                    st.toast("Randomized Exam Published!", icon="🎲")
+                    st.rerun()
+
         # --- DOWNLOAD & RESULTS SECTION ---
         # This part runs regardless of whether you just clicked generate
-        current_quiz = load_quiz_from_disk()
+        snapshot = get_exam_store().snapshot(exam_id) if exam_id else None
+        current_quiz = snapshot.exam if snapshot else None
         if current_quiz:
             st.write("---")
             st.write("### 📥 Manage Current Exam")
-            
-            report_text = "ABAP Assessment AI - EXAM KEY\n" + "="*20 + "\n"
-            for i, item in enumerate(current_quiz):
-                report_text += f"Q{i+1}: {item['question']}\nAns: {item['answer']}\n\n"
+            st.caption(f"Exam **{exam_id}**, version {snapshot.version}, published {snapshot.published_at}.")
+            if is_bank_exam(current_quiz):
+                filters = {k: current_quiz.get(k) for k in ("topic", "difficulty", "q_type")}
+                pool_ids = current_quiz.get("pool") or get_question_bank().question_ids(**filters)
+                st.write(
+                    f"Randomized exam: **{current_quiz['count']}** questions per student, drawn from "
+                    f"**{len(pool_ids)}** bank questions ({', '.join(v for v in filters.values() if v) or 'all topics'})."
+                )
+                # The key of a randomized exam is the key of its whole pool, which is only
+                # loaded when the key is downloaded; questions to fix are found by search.
+                load_key = lambda: get_question_bank().get_questions(pool_ids)
+                fix_candidates = None
+            else:
+                # The bank holds the current key, including any corrections made below.
+                current_quiz = get_question_bank().get_questions(exam_question_ids(current_quiz))
+                load_key = lambda: current_quiz
+                fix_candidates = current_quiz
             
             st.download_button(
                 label="Download Answer Key (TXT)",
-                data=report_text,
+                # Built on click, and rebuilt only when the exam is republished or the bank changes.
+                data=lambda: answer_key_txt(
+                    (exam_id, snapshot.version, snapshot.published_at, get_question_bank().version()),
+                    load_key
+                ),
                 file_name="quiz_key.txt"
             )
 
+            with st.expander("🛠️ Fix Answer Key & Re-grade"):
+                if fix_candidates is None:
+                    query = st.text_input("Find Question", placeholder="Bank ID or words from the question").strip()
+                    fix_candidates = find_pool_questions(query, pool_ids) if query else []
+                    if query and not fix_candidates:
+                        st.info("No question in this exam's pool matches.")
+                    fix_label = lambda i: f"ID {fix_candidates[i]['id']}: {fix_candidates[i]['question'][:80]}"
+                else:
+                    fix_label = lambda i: f"Q{i+1}: {fix_candidates[i]['question'][:80]}"
+                if fix_candidates:
+                    fix_idx = st.selectbox("Question", range(len(fix_candidates)), format_func=fix_label)
+                    fix_item = fix_candidates[fix_idx]
+                    st.caption(f"Current answer: {fix_item['answer']}")
+                    fix_options = list(fix_item['options'])
+                    current_index = key_index(fix_options, fix_item['answer'])
+                    fix_option = st.radio(
+                        "Correct option", fix_options, key=f"fix_key_{fix_item['id']}",
+                        index=current_index if current_index >= 0 else None
+                    )
+                    if st.button("Save Key & Re-grade"):
+                        if fix_option is None or fix_options.index(fix_option) == current_index:
+                            st.info("The answer key is unchanged.")
+                        else:
+                            get_question_bank().update_answer(fix_item['id'], answer_label(fix_option))
+                            changed = regrade_all(get_submission_store(), get_question_bank())
+                            st.success(f"Answer key updated. {changed} submission score(s) changed.")
+
         st.write("---")
         st.subheader("📊 Student Submissions")
-        all_results = load_all_results()
+        # Results, statistics and exports all cover the exam selected above.
+        all_results = load_all_results(exam_id) if exam_id else []
         if all_results:
+            st.caption(f"Submissions to exam **{exam_id}**.")
+            if st.button("🔁 Re-grade All Submissions"):
+                changed = regrade_all(get_submission_store(), get_question_bank(), exam_id=exam_id)
+                st.success(f"Re-graded against the current key. {changed} score(s) changed.")
+                all_results = load_all_results(exam_id)
             st.table(all_results)
-            
-            # PDF Download Logic
-            pdf_bytes = create_pdf_report(all_results)
-            st.download_button(
-                label="📄 Download Results as PDF",
-                data=pdf_bytes,
-                file_name="student_results.pdf",
-                mime="application/pdf"
+
+            stats = get_item_stats(exam_id).refresh(get_submission_store(), get_question_bank())
+            summary = stats.summary()
+            pcts = summary['percentiles']
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Submissions", summary['submissions'])
+            m2.metric("Mean Score", f"{summary['mean']:.1f}%")
+            m3.metric("Median", f"{pcts[50]}%")
+            m4.metric("25th / 75th / 90th", f"{pcts[25]} / {pcts[75]} / {pcts[90]}")
+            bands = [int(summary['histogram'][lo:lo + 10].sum()) for lo in range(0, 90, 10)]
+            bands.append(int(summary['histogram'][90:].sum()))
+            st.bar_chart(
+                {"Score band": [f"{lo}-{lo + 9}%" for lo in range(0, 90, 10)] + ["90-100%"], "Students": bands},
+                x="Score band", y="Students"
             )
+
+            items = stats.items()
+            if len(items['question_id']):
+                with st.expander("📈 Item Analysis"):
+                    st.caption(
+                        "Difficulty is the share of students answering correctly; discrimination is the "
+                        "correlation between getting the question right and the overall score."
+                    )
+                    item_questions = {
+                        q['id']: q for q in get_question_bank().get_questions(items['question_id'].tolist())
+                    }
+                    item_rows = []
+                    for qid, attempts, p, disc, picks in zip(
+                        items['question_id'], items['attempts'], items['difficulty'],
+                        items['discrimination'], items['choices']
+                    ):
+                        item = item_questions.get(int(qid), {"question": "(removed)", "options": []})
+                        item_rows.append({
+                            "ID": int(qid),
+                            "Question": item['question'][:70],
+                            "Attempts": int(attempts),
+                            "Difficulty": round(float(p), 2),
+                            "Discrimination": None if math.isnan(disc) else round(float(disc), 2),
+                            "Option Picks": " · ".join(
+                                f"{answer_label(opt)}: {int(n)}" for opt, n in zip(item['options'], picks)
+                            ),
+                        })
+                    st.dataframe(item_rows, hide_index=True)
+            
+            # Exports are built when clicked and cached until the submissions change.
+            store = get_submission_store()
+            bank = get_question_bank()
+            # The count the name was chosen from also picks PDF or ZIP when the button is clicked.
+            result_count = len(all_results)
+            pdf_name, pdf_mime = results_pdf_format(result_count)
+            dl1, dl2, dl3 = st.columns(3)
+            with dl1:
+                st.download_button(
+                    label="📄 Download Results as PDF",
+                    data=lambda: results_pdf(store, count=result_count, exam_id=exam_id),
+                    file_name=f"{exam_id}_{pdf_name}",
+                    mime=pdf_mime
+                )
+            with dl2:
+                st.download_button(
+                    label="🧾 Download Results as CSV",
+                    data=lambda: results_csv(store, exam_id=exam_id),
+                    file_name=f"{exam_id}_student_results.csv",
+                    mime="text/csv"
+                )
+            with dl3:
+                st.download_button(
+                    label="🗂️ Download Student Reports (ZIP)",
+                    data=lambda: student_reports_zip(store, bank, exam_id=exam_id),
+                    file_name=f"{exam_id}_student_reports.zip",
+                    mime="application/zip"
+                )
         else:
-            st.info("No students have submitted yet.")
+            st.info("No students have submitted to this exam yet.")
+
+        with st.expander("⏱️ Performance Metrics"):
+            metrics_panel()
 # --- STUDENT VIEW ---
 # --- STUDENT VIEW ---
 elif st.session_state.role == "Student":
     st.subheader("✍️ Student Examination")
-    quiz = load_quiz_from_disk()
+    exam_ids = get_exam_store().exam_ids()
+    exam_id = st.selectbox("Exam", exam_ids) if len(exam_ids) > 1 else (exam_ids or [DEFAULT_EXAM])[0]
+    # One snapshot per run, so the questions and the checkpoint key always match.
+    snapshot = get_exam_store().snapshot(exam_id)
+    quiz = snapshot.exam
     
     if not quiz:
         st.info("No exam available.")
     
     # CASE 1: Exam already submitted (CHECK INDENTATION HERE)
-    elif st.session_state.get('exam_submitted'):
+    elif exam_id in st.session_state.submitted_exams:
         st.success("✅ Exam submitted successfully!")
+        result = st.session_state.submitted_exams[exam_id]
         
-        if 'last_score' in st.session_state:
+        if 'score' in result:
             col1, col2 = st.columns(2)
             with col1:
-                st.metric("Total Score", st.session_state.last_score)
+                st.metric("Total Score", result['score'])
             with col2:
                 # Color coded Pass/Fail
-                color = "#28a745" if st.session_state.last_status == "PASS" else "#dc3545"
-                st.markdown(f"### Status: <span style='color:{color};'>{st.session_state.last_status}</span>", unsafe_allow_html=True)
+                color = "#28a745" if result['status'] == "PASS" else "#dc3545"
+                st.markdown(f"### Status: <span style='color:{color};'>{result['status']}</span>", unsafe_allow_html=True)
             
-            st.write(f"**Overall Performance: {st.session_state.last_pct:.1f}%**")
-            st.progress(st.session_state.last_pct / 100)
+            st.write(f"**Overall Performance: {result['pct']:.1f}%**")
+            st.progress(result['pct'] / 100)
 
             st.download_button(
                 label="📊 Download Detailed Report", 
-                data=st.session_state.get('last_report', ''), 
+                data=result.get('report', ''), 
                 file_name="result.txt",
                 key="student_download_final" 
             )
@@ -445,49 +652,104 @@ elif st.session_state.role == "Student":
     # CASE 2: Taking the exam (CHECK INDENTATION HERE)
     else:
         name = st.text_input("Full Name:", placeholder="Required to submit")
+        quiz = assemble_student_quiz(quiz, name)
+        # Answers are checkpointed under the student's name, so it is needed up front.
+        if not quiz or not name.strip():
+            st.info("Enter your full name to start the exam.")
+            record_render_time()
+            st.stop()
         
         # Timer Logic
-        if 'start_time' not in st.session_state: 
-            st.session_state.start_time = time.time()
+        start_time = st.session_state.start_times.setdefault(exam_id, time.time())
         
         timer_box = st.empty()
-        rem = max(0, 1800 - (time.time() - st.session_state.start_time))
+        rem = max(0, 1800 - (time.time() - start_time))
         timer_box.markdown(f'<div class="timer-container"><span class="timer-text">⏳ {int(rem//60):02d}:{int(rem%60):02d}</span></div>', unsafe_allow_html=True)
 
+        # --- PAGED EXAM WITH CHECKPOINTS ---
+        # Answers live server-side, keyed by exam version and student, so only
+        # the current page is rendered and a refresh resumes where it left off.
+        store = get_submission_store()
+        exam_key = f"{exam_id}:v{snapshot.version}"
+        session_key = (exam_key, " ".join(name.lower().split()))
+        if st.session_state.get('checkpoint_key') != session_key:
+            checkpoint = store.load_checkpoint(exam_key, name) or {}
+            st.session_state.exam_answers = {int(k): v for k, v in checkpoint.get('answers', {}).items()}
+            st.session_state.exam_page = checkpoint.get('page', 0)
+            st.session_state.checkpoint_key = session_key
+        answers = st.session_state.exam_answers
+        num_pages = -(-len(quiz) // EXAM_PAGE_SIZE)
+        page = min(st.session_state.exam_page, num_pages - 1)
+        first = page * EXAM_PAGE_SIZE
+        page_items = list(enumerate(quiz))[first:first + EXAM_PAGE_SIZE]
+
+        st.caption(f"Page {page + 1} of {num_pages} · {len(answers)} of {len(quiz)} answered")
         with st.form("exam_form"):
             user_ans = {}
-            for i, item in enumerate(quiz):
+            for i, item in page_items:
                 st.write(f"**Q{i+1}: {item['question']}**")
                 # RADIO FIX: index=None removes default selection
                 user_ans[i] = st.radio(
                     "Select:", 
                     item['options'], 
-                    key=f"q{i}_{name.replace(' ', '_')}", 
-                    index=None, 
+                    key=f"q{i}_{exam_key}_{name.replace(' ', '_')}", 
+                    index=answers.get(i), 
                     label_visibility="collapsed"
                 )
             
+            nav1, nav2 = st.columns(2)
+            with nav1:
+                prev_btn = st.form_submit_button("⬅️ Previous Page", disabled=page == 0)
+            with nav2:
+                next_btn = st.form_submit_button("Save & Next Page ➡️", disabled=page == num_pages - 1)
             sub_btn = st.form_submit_button("Submit Final Answers")
+
+            if prev_btn or next_btn or sub_btn:
+                for i, selected_option in user_ans.items():
+                    if selected_option is not None:
+                        answers[i] = list(quiz[i]['options']).index(selected_option)
+                if prev_btn:
+                    page -= 1
+                elif next_btn:
+                    page += 1
+                st.session_state.exam_page = page
+                store.save_checkpoint(exam_key, name, {"page": page, "answers": answers})
+                if not sub_btn:
+                    st.rerun()
             
             if sub_btn:
-                if not name:
-                    st.error("Enter your name first!")
-                elif None in user_ans.values():
-                    st.error("Please answer all questions before submitting.")
+                # Grade from the checkpoint, not from the widgets on screen.
+                checkpoint = store.load_checkpoint(exam_key, name) or {}
+                saved = {int(k): v for k, v in checkpoint.get('answers', {}).items()}
+                unanswered = [i + 1 for i in range(len(quiz)) if i not in saved]
+                if unanswered:
+                    st.error(f"Please answer all questions before submitting. Unanswered: {', '.join(f'Q{n}' for n in unanswered)}")
                 else:
-                    score = 0
+                    user_ans = {i: quiz[i]['options'][saved[i]] for i in range(len(quiz))}
+                    answer_vector = [saved[i] for i in range(len(quiz))]
+                    question_ids = exam_question_ids(quiz, add_missing=False)
+                    if None in question_ids:
+                        # A legacy exam the bank does not hold: grade against its own key.
+                        # Without bank ids the submission cannot be re-graded later.
+                        question_ids = None
+                        correct = [a == key_index(item['options'], item['answer']) for a, item in zip(answer_vector, quiz)]
+                        correct_answers = [item['answer'] for item in quiz]
+                    else:
+                        # Grade against the bank's current key, the same way re-grading does.
+                        key_items = {item['id']: item for item in get_question_bank().get_questions(question_ids)}
+                        correct = mark(question_ids, answer_vector, build_key(list(key_items.values())))
+                        correct_answers = [key_items.get(qid, item)['answer'] for qid, item in zip(question_ids, quiz)]
+                    score = int(sum(correct))
                     # HEADER FOR REPORT
                     report = f"ABAP Assessment RESULT\nStudent: {name}\n"
                     report += f"Date: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
                     report += "="*30 + "\n\n"
                     
                     for i, item in enumerate(quiz):
-                        correct_letter = item['answer'].strip().upper()
                         selected_option = user_ans[i]
                         
                         # Check correctness
-                        if selected_option and selected_option.strip().upper().startswith(correct_letter):
-                            score += 1
+                        if correct[i]:
                             status = "CORRECT ✅"
                         else:
                             status = "INCORRECT ❌"
@@ -495,7 +757,7 @@ elif st.session_state.role == "Student":
                         # --- ADDING DETAIL TO REPORT ---
                         report += f"Question {i+1}: {item['question']}\n"
                         report += f"Your Selection: {selected_option}\n"
-                        report += f"Correct Answer: {item['answer']}\n"
+                        report += f"Correct Answer: {correct_answers[i]}\n"
                         report += f"Result: {status}\n"
                         report += "-"*20 + "\n"
                     
@@ -503,24 +765,26 @@ elif st.session_state.role == "Student":
                     pct = (score / len(quiz)) * 100
                     status_text = "PASS" if pct >= 70 else "FAIL"
                     
-                    # Update Session State
-                    st.session_state.exam_submitted = True
-                    st.session_state.last_score = f"{score}/{len(quiz)}"
-                    st.session_state.last_pct = pct
-                    st.session_state.last_status = status_text
-                    
                     # Finalize Report Text
                     report += f"\nSUMMARY\n"
                     report += f"Total Score: {score}/{len(quiz)}\n"
                     report += f"Percentage: {pct:.1f}%\n"
                     report += f"Status: {status_text}\n"
-                    st.session_state.last_report = report
                     
-                    save_student_score(name, score, len(quiz))
+                    # Update Session State
+                    st.session_state.submitted_exams[exam_id] = {
+                        "score": f"{score}/{len(quiz)}", "pct": pct, "status": status_text, "report": report,
+                    }
+                    
+                    save_student_score(
+                        name, score, len(quiz), question_ids=question_ids, answers=answer_vector,
+                        exam_id=exam_id, exam_version=snapshot.version
+                    )
+                    store.delete_checkpoint(exam_key, name)
                     st.rerun()
         st.download_button(
             label="📊 Download Detailed Report", 
-            data=st.session_state.get('last_report', ''), 
+            data=st.session_state.submitted_exams.get(exam_id, {}).get('report', ''), 
             file_name="result.txt",
             key="student_download_final" 
         )
@@ -528,9 +792,12 @@ elif st.session_state.role == "Student":
         # st.session_state.last_report = report
         # st.rerun()
         # Update Timer
-        rem = max(0, 2400 - (time.time() - st.session_state.start_time))
+        rem = max(0, 2400 - (time.time() - start_time))
         timer_box.markdown(f'<div class="timer-container"><span class="timer-text">⏳ {int(rem//60):02d}:{int(rem%60):02d}</span></div>', unsafe_allow_html=True)
 
+# Runs that end in st.stop() or st.rerun() are not measured.
+record_render_time()
+
 # if st.session_state.get('exam_submitted') and st.session_state.role == "Student":
    # st.metric("Final Score", st.session_state.get('last_score'))
   #  st.download_button("📊 Download Report", st.session_state.get('last_report'), file_name="result.txt")
@@ -0,0 +1,337 @@
+"""Offline benchmark suite for the exam pipeline.
+
+Run from the repository root::
+
+    python -m benchmarks.run                      # full suite
+    python -m benchmarks.run --quick              # small inputs, for a smoke run
+    python -m benchmarks.run --only parse grading
+    python -m benchmarks.run --compare old.json   # print the change against a previous run
+
+No network access is needed. Documents are synthetic PDFs (see
+``benchmarks.synthetic``), the model is ``FakeClient`` with a configurable
+latency and response template, and every cache and database lives in a
+temporary directory. Results are written as JSON (``--output``) together
+with the commit, Python version and CPU count they were measured on.
+
+The cold start of the student page is measured separately by
+``python -m benchmarks.startup``.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import synthetic
+
+TEMPLATES = {
+    # The format the prompt asks for.
+    "clean": (
+        "Q: Which statement describes {subject}?\n"
+        "A) First option\nB) Second option\nC) Third option\nD) Fourth option\n"
+        "Answer: A\n"
+    ),
+    # Numbered questions, "." options and a stray line, as models often answer.
+    "noisy": (
+        "{n}. Which statement describes {subject}?\n"
+        "A. First option\nB. Second option\nC. Third option\nD. Fourth option\n"
+        "Here is why this matters for {subject}.\n"
+        "Correct: B\n"
+    ),
+    # Two questions per template, the second without options, so parse yield is about 50%.
+    "lossy": (
+        "Q: Which statement describes {subject}?\n"
+        "A) First option\nB) Second option\n"
+        "Answer: A\n"
+        "Q: What is missing from {subject}?\n"
+        "Answer: C\n"
+    ),
+}
+# Questions each template holds; the rest hold one.
+TEMPLATE_QUESTIONS = {"lossy": 2}
+QUICK = {
+    "text_pages": 8, "bank_rows": 60, "questions": 10, "parse_questions": 200, "latency": 0.05,
+    "submissions": 300, "writers": 4, "writes_per_writer": 25, "report_rows": 500, "repeat": 2,
+}
+CASES = (
+    "pdf_extract", "table_import", "parse", "generation", "grading", "submission_writes", "results_report",
+)
+
+
+def timings(samples):
+    return {
+        "repeat": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def measure(fn, repeat):
+    """Run ``fn`` ``repeat`` times; return its timings and the last return value."""
+    samples, value = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        samples.append(time.perf_counter() - start)
+    return timings(samples), value
+
+
+# --- CASES ---
+def fake_client(args, latency=0.0):
+    from question_gen import FakeClient
+
+    return FakeClient(
+        latency=latency, template=TEMPLATES[args.template],
+        questions_per_template=TEMPLATE_QUESTIONS.get(args.template, 1),
+    )
+
+
+def bench_pdf_extract(args, work):
+    import pdf_extract
+
+    path = os.path.join(work, "manual.pdf")
+    synthetic.text_manual_pdf(path, pages=args.text_pages)
+    result = {"pages": args.text_pages}
+    for workers in sorted({1, args.workers}):
+        # _extract_text bypasses the content cache, so every repeat is a cold extraction.
+        result[f"cold_workers_{workers}"], text = measure(lambda: pdf_extract._extract_text(path, workers), args.repeat)
+    result["text_chars"] = len(text)
+    pdf_extract.extract_chapters_from_pdf(path, workers=args.workers)
+    result["warm_cache"], _ = measure(lambda: pdf_extract.extract_chapters_from_pdf(path), args.repeat)
+    return result
+
+
+def bench_table_import(args, work):
+    from table_import import import_table_pdf
+
+    path = os.path.join(work, "bank.pdf")
+    synthetic.table_bank_pdf(path, rows=args.bank_rows, bad_every=25)
+    result = {"rows": args.bank_rows}
+    for workers in sorted({1, args.workers}):
+        result[f"workers_{workers}"], (questions, errors) = measure(
+            lambda: import_table_pdf(path, workers=workers), args.repeat
+        )
+    result.update(imported=len(questions), rejected=len(errors))
+    return result
+
+
+def bench_parse(args, work):
+    from question_parser import StreamingQuestionParser, parse_generated_questions
+
+    client = fake_client(args)
+    raw = client.generate(f"Generate EXACTLY {args.parse_questions} questions")
+    chunks = list(fake_client(args).generate_stream(
+        f"Generate EXACTLY {args.parse_questions} questions"
+    ))
+
+    def streamed():
+        parser = StreamingQuestionParser("MCQ")
+        return [q for chunk in chunks for q in parser.feed(chunk)] + parser.close()
+
+    whole, parsed = measure(lambda: parse_generated_questions(raw, "MCQ"), args.repeat)
+    stream, _ = measure(streamed, args.repeat)
+    return {
+        "questions_requested": args.parse_questions, "questions_parsed": len(parsed),
+        "raw_chars": len(raw), "whole_text": whole, "streamed": stream,
+    }
+
+
+def bench_generation(args, work):
+    from pdf_extract import _extract_text
+    from question_gen import generate_quiz
+
+    path = os.path.join(work, "manual.pdf")
+    if not os.path.exists(path):
+        synthetic.text_manual_pdf(path, pages=args.text_pages)
+    text = _extract_text(path, 1)
+    stats = {}
+
+    def run():
+        client = fake_client(args, latency=args.latency)
+        questions, errors = generate_quiz(
+            text, "Medium", args.questions, "MCQ", client=client, max_concurrency=args.concurrency, use_cache=False
+        )
+        stats.update(questions=len(questions), errors=len(errors), questions_requested=client.requested)
+        return questions
+
+    result, _ = measure(run, args.repeat)
+    return {
+        "questions": args.questions, "latency_per_batch": args.latency, "template": args.template,
+        "concurrency": args.concurrency, "end_to_end": result, **stats,
+    }
+
+
+def bench_grading(args, work):
+    import numpy as np
+
+    from grading import build_key, grade, pack, regrade_all
+    from question_bank import QuestionBank
+    from submission_store import SubmissionStore
+
+    bank = QuestionBank(os.path.join(work, "grading_bank.db"))
+    ids = bank.ids_for(synthetic.exam_questions(200))
+    papers = synthetic.submissions(ids, args.submissions, per_paper=40)
+    key = build_key(bank.get_questions(ids))
+    qid_vectors = [np.asarray(q, dtype=np.int32) for q, _ in papers]
+    answer_vectors = [np.asarray(a, dtype=np.int8) for _, a in papers]
+    vectorised, _ = measure(lambda: grade(qid_vectors, answer_vectors, key), args.repeat)
+
+    store = SubmissionStore(os.path.join(work, "grading_results.db"))
+    for paper, answers in papers:
+        question_ids, packed = pack(paper, answers)
+        # A deliberately wrong score so the first re-grade has rows to update.
+        store.append("bench", 0, len(paper), question_ids=question_ids, answers=packed)
+    # The first re-grade rewrites scores; later ones only compare.
+    first, changed = measure(lambda: regrade_all(store, bank), 1)
+    again, _ = measure(lambda: regrade_all(store, bank), args.repeat)
+    return {"submissions": args.submissions, "questions_per_paper": 40, "grade": vectorised,
+            "regrade_all_updating": first, "scores_updated": changed, "regrade_all_unchanged": again}
+
+
+def bench_submission_writes(args, work):
+    from submission_store import SubmissionStore
+
+    store = SubmissionStore(os.path.join(work, "writes.db"))
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(n):
+        own = []
+        for i in range(args.writes_per_writer):
+            start = time.perf_counter()
+            store.append(f"writer {n} student {i}", i % 10, 10)
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    total = args.writers * args.writes_per_writer
+    return {
+        "writers": args.writers, "writes": total, "seconds": elapsed, "writes_per_second": total / elapsed,
+        "latency_p50": latencies[len(latencies) // 2], "latency_p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def bench_results_report(args, work):
+    # create_pdf_report was replaced by the cached, streaming exports in exports.py.
+    from exports import write_results_csv, write_results_pdf, write_results_pdf_parts
+
+    rows = [
+        (i, f"Student {i}", i % 21, 20, "2024-01-01 10:00:00", None, None, "default", 1) for i in range(args.report_rows)
+    ]
+    path = os.path.join(work, "report.out")
+    pdf, _ = measure(lambda: write_results_pdf(rows, path), args.repeat)
+    pdf_bytes = os.path.getsize(path)
+    parts, _ = measure(lambda: write_results_pdf_parts(rows, path, count=len(rows)), args.repeat)
+    csv_timings, _ = measure(lambda: write_results_csv(rows, path), args.repeat)
+    return {"rows": args.report_rows, "pdf": pdf, "pdf_bytes": pdf_bytes, "pdf_parts": parts, "csv": csv_timings}
+
+
+# --- DRIVER ---
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the change in median time of every measurement against a previous run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    def medians(tree, prefix=""):
+        for key, value in tree.items():
+            if isinstance(value, dict) and "median" in value:
+                yield prefix + key, value["median"]
+            elif isinstance(value, dict):
+                yield from medians(value, f"{prefix}{key}.")
+
+    before = dict(medians(baseline))
+    for name, now in medians(results):
+        if name in before and before[name]:
+            print(f"{name:45s} {before[name]:10.4f}s -> {now:10.4f}s  ({(now / before[name] - 1) * 100:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", nargs="+", choices=CASES, help="run only these benchmarks")
+    parser.add_argument("--quick", action="store_true", help="small inputs for a fast smoke run")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/bench-<time>.json)")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="process pool size")
+    parser.add_argument("--text-pages", type=int, default=60)
+    parser.add_argument("--bank-rows", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=50, help="questions per generated exam")
+    parser.add_argument("--parse-questions", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model seconds per batch")
+    parser.add_argument("--template", choices=sorted(TEMPLATES), default="clean", help="fake model response template")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent model batches")
+    parser.add_argument("--submissions", type=int, default=5000)
+    parser.add_argument("--writers", type=int, default=16, help="concurrent submission writer threads")
+    parser.add_argument("--writes-per-writer", type=int, default=50)
+    parser.add_argument("--report-rows", type=int, default=5000)
+    args = parser.parse_args(argv)
+    if args.quick:
+        for name, value in QUICK.items():
+            if getattr(args, name) == parser.get_default(name):
+                setattr(args, name, value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work = tempfile.mkdtemp(prefix="bodha-bench-")
+    # Module settings are read at import time, so point them at the scratch directory first.
+    # The page threshold is lowered so --workers is honoured even for small documents.
+    os.environ.update(BODHA_CACHE_DIR=os.path.join(work, "cache"), BODHA_JOB_DIR=os.path.join(work, "jobs"),
+                      BODHA_METRICS="0", BODHA_PARALLEL_MIN_PAGES="1")
+    results = {}
+    try:
+        for case in args.only or CASES:
+            print(f"running {case}...", file=sys.stderr)
+            results[case] = globals()[f"bench_{case}"](args, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"results written to {output}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
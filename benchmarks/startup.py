@@ -0,0 +1,100 @@
+"""Cold-start and rerun cost of the student view.
+
+Run from the repository root::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --source /path/to/other/checkout   # e.g. an older commit
+
+Each trial starts a fresh interpreter, renders the student page once with
+Streamlit's ``AppTest`` (so the first render includes importing the app's
+modules) and then reruns it. The trial reports both times, the peak RSS,
+the size of the markdown the page sends and which Examiner-only modules
+were loaded. Streamlit itself is imported before the clock starts, since
+every deployment pays for it alike. The app runs in a temporary copy of
+``--source`` so its databases do not touch the checkout.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ("pdfplumber", "google.generativeai", "fpdf")
+CHILD = r"""
+import json, resource, sys, time
+from streamlit.testing.v1 import AppTest
+
+start = time.perf_counter()
+at = AppTest.from_file("Bodha_Final.py", default_timeout=120)
+at.secrets["GEMINI_API_KEY"] = "benchmark"
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+print(json.dumps({
+    "first_render": first,
+    "rerun": rerun,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "markdown_bytes": sum(len(m.value) for m in at.markdown),
+    "errors": [e.value for e in at.exception],
+    "heavy_modules": [m for m in HEAVY if m in sys.modules],
+}))
+"""
+
+
+def copy_app(source, target):
+    shutil.copytree(
+        source, target,
+        ignore=shutil.ignore_patterns(".git", "benchmarks", "*.db", "*.db-*", ".bodha_*", "__pycache__"),
+    )
+
+
+def trial(app_dir):
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{CHILD}"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True, check=True,
+        env={**os.environ, "BODHA_METRICS": "0"},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="bodha-startup-")
+    try:
+        app_dir = os.path.join(work, "app")
+        copy_app(args.source, app_dir)
+        trial(app_dir)  # compiles the bytecode and creates the databases
+        runs = [trial(app_dir) for _ in range(args.trials)]
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    result = {"source": os.path.abspath(args.source), "trials": args.trials}
+    for field in ("first_render", "rerun", "max_rss_mb", "markdown_bytes"):
+        result[field] = statistics.median(run[field] for run in runs)
+    result["heavy_modules"] = runs[-1]["heavy_modules"]
+    result["errors"] = runs[-1]["errors"]
+    print(f"first render   {result['first_render'] * 1000:8.1f} ms")
+    print(f"rerun          {result['rerun'] * 1000:8.1f} ms")
+    print(f"peak RSS       {result['max_rss_mb']:8.1f} MB")
+    print(f"markdown sent  {result['markdown_bytes'] / 1024:8.1f} KB")
+    print(f"heavy modules  {', '.join(result['heavy_modules']) or '-'}")
+    if result["errors"]:
+        print(f"app errors     {result['errors']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Deterministic synthetic inputs for the benchmarks.
+
+Everything is generated from a seed, so two runs of the suite measure the
+same documents and the same submissions.
+"""
+import random
+
+from fpdf import FPDF
+
+VOCABULARY = (
+    "abap hana cds view amdp association annotation buffer cursor database dictionary domain "
+    "element entity field function group index internal join key lock loop method module "
+    "object package parameter procedure projection query report runtime schema select "
+    "session structure table transaction transport type update variant workflow"
+).split()
+TABLE_HEADER = ["Questions", "A", "B", "C", "D", "Answer"]
+TABLE_WIDTHS = [86, 22, 22, 22, 22, 16]
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def text_manual_pdf(path, pages=20, paragraphs_per_page=6, seed=1):
+    """A text-heavy manual: a chapter heading every ten pages and dense paragraphs."""
+    rng = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_auto_page_break(False)
+    for page in range(pages):
+        pdf.add_page()
+        if page % 10 == 0:
+            pdf.set_font("Arial", "B", 14)
+            pdf.cell(0, 10, f"Chapter {page // 10 + 1}: {sentence(rng, 4)}", ln=True)
+        pdf.set_font("Arial", "", 10)
+        for _ in range(paragraphs_per_page):
+            pdf.multi_cell(0, 5, " ".join(sentence(rng) for _ in range(4)))
+            pdf.ln(2)
+    pdf.output(path, "F")
+
+
+def fit_cell(pdf, words, width, suffix=""):
+    """Drop trailing ``words`` until the text (plus ``suffix``) fits a ``width`` mm cell.
+
+    Text wider than its cell spills into the next column, where the
+    importer would read it as part of that column's value.
+    """
+    while len(words) > 1 and pdf.get_string_width(" ".join(words) + suffix) > width - 2 * pdf.c_margin:
+        words = words[:-1]
+    return " ".join(words) + suffix
+
+
+def table_bank_pdf(path, rows=200, rows_per_page=25, bad_every=0, seed=2):
+    """A question bank in the ``Questions | A | B | C | D | Answer`` table layout.
+
+    Every ``bad_every``-th row gets an invalid answer so the importer's
+    validation path is exercised too.
+    """
+    rng = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_auto_page_break(False)
+    for start in range(0, rows, rows_per_page):
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 7)
+        for width, title in zip(TABLE_WIDTHS, TABLE_HEADER):
+            pdf.cell(width, 8, title, 1)
+        pdf.ln()
+        pdf.set_font("Arial", "", 7)
+        for i in range(start, min(rows, start + rows_per_page)):
+            answer = "Z" if bad_every and i % bad_every == 0 else rng.choice("ABCD")
+            question = fit_cell(pdf, [f"Q{i}", *rng.sample(VOCABULARY, 7)], TABLE_WIDTHS[0], "?")
+            # Distinct first words keep the options distinct however far they are trimmed.
+            words = rng.sample(VOCABULARY, 8)
+            options = [fit_cell(pdf, words[k:k + 2], width) for k, width in zip(range(0, 8, 2), TABLE_WIDTHS[1:5])]
+            cells = [question] + options + [answer]
+            for width, cell in zip(TABLE_WIDTHS, cells):
+                pdf.cell(width, 8, cell, 1)
+            pdf.ln()
+    pdf.output(path, "F")
+
+
+def exam_questions(count, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "question": f"Which statement describes {' '.join(rng.sample(VOCABULARY, 6))} ({i})?",
+            "options": [f"{letter}) {' '.join(rng.sample(VOCABULARY, 3))}" for letter in "ABCD"],
+            "answer": rng.choice("ABCD"),
+        }
+        for i in range(count)
+    ]
+
+
+def submissions(question_ids, count, per_paper, seed=4):
+    """``(question_ids, answers)`` pairs for ``count`` students, each shown ``per_paper`` questions."""
+    rng = random.Random(seed)
+    per_paper = min(per_paper, len(question_ids))
+    result = []
+    for _ in range(count):
+        paper = rng.sample(question_ids, per_paper)
+        result.append((paper, [rng.randrange(4) for _ in paper]))
+    return result
@@ -0,0 +1,101 @@
+"""Near-duplicate detection for questions.
+
+Questions are normalised (case, punctuation, articles) and compared as
+sets of character shingles. MinHash signatures split into LSH bands give a
+short list of candidates for each lookup, so checking a question does not
+scan the whole exam; candidates are then confirmed with the exact Jaccard
+similarity of their shingle sets.
+"""
+import os
+import re
+import zlib
+
+import numpy as np
+
+DEDUP_THRESHOLD = float(os.getenv("BODHA_DEDUP_THRESHOLD", "0.8"))
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+_ARTICLES = frozenset(("a", "an", "the"))
+
+
+def normalize_question(text):
+    words = _NON_WORD_RE.sub(" ", str(text).lower()).split()
+    return " ".join(w for w in words if w not in _ARTICLES)
+
+
+def shingles(normalized, k=4):
+    if len(normalized) <= k:
+        return {normalized}
+    return {normalized[i:i + k] for i in range(len(normalized) - k + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """Set of questions that rejects additions too similar to an existing one.
+
+    ``threshold`` is the Jaccard similarity of shingle sets at or above which
+    two questions count as duplicates.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=64, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Multiply-shift hash family: (a * x + b) mod 2**64, keeping the high 32 bits.
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+        self._exact = set()
+        self._shingles = []
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._shingles)
+
+    def _signature(self, shingle_set):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64)
+        return ((self._a * hashes + self._b) >> np.uint64(32)).min(axis=1)
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [(band, signature[band * r:(band + 1) * r].tobytes()) for band in range(self.bands)]
+
+    def is_duplicate(self, text):
+        normalized = normalize_question(text)
+        if normalized in self._exact:
+            return True
+        shingle_set = shingles(normalized)
+        return self._match(shingle_set, self._band_keys(self._signature(shingle_set)))
+
+    def _match(self, shingle_set, band_keys):
+        seen = set()
+        for key in band_keys:
+            for idx in self._buckets.get(key, ()):
+                if idx not in seen:
+                    seen.add(idx)
+                    if jaccard(shingle_set, self._shingles[idx]) >= self.threshold:
+                        return True
+        return False
+
+    def add(self, text):
+        """Add ``text`` unless it duplicates an indexed question; return whether it was added."""
+        normalized = normalize_question(text)
+        if normalized in self._exact:
+            return False
+        shingle_set = shingles(normalized)
+        band_keys = self._band_keys(self._signature(shingle_set))
+        if self._match(shingle_set, band_keys):
+            return False
+        idx = len(self._shingles)
+        self._exact.add(normalized)
+        self._shingles.append(shingle_set)
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(idx)
+        return True
@@ -0,0 +1,145 @@
+"""Size-bounded, content-addressed cache on local disk.
+
+Values are stored as individual blob files next to a small SQLite index
+that records their size and last access time. When the total size grows
+past ``max_bytes`` the least recently used entries are evicted. The cache
+lives on disk, so it survives restarts and is shared by every session and
+process pointed at the same directory.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    created REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access);
+"""
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, root, max_bytes, ttl=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(root, "index.db"), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+        if "created" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN created REAL NOT NULL DEFAULT 0")
+
+    def _blob_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Return the cached bytes for ``key`` or ``None``."""
+        if self.ttl is not None:
+            with self._lock:
+                row = self._conn.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < time.time() - self.ttl:
+                if row is not None:
+                    self.delete(key)
+                with self._lock:
+                    self.misses += 1
+                return None
+        try:
+            with open(self._blob_path(key), "rb") as f:
+                value = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def set(self, key, value):
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        self._record(key, len(value))
+
+    def set_file(self, key, src_path):
+        """Move the finished file ``src_path`` into the cache under ``key``.
+
+        Lets large values be written to disk incrementally instead of being
+        held in memory for ``set``.
+        """
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        # shutil.move copies when the source is on another filesystem.
+        shutil.move(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._record(key, os.path.getsize(path))
+
+    def _record(self, key, size):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_access, created) VALUES (?, ?, ?, ?)",
+                (key, size, now, now),
+            )
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def _drop(self, key):
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(self._blob_path(key))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _evict(self):
+        if self.ttl is not None:
+            for (key,) in self._conn.execute(
+                "SELECT key FROM entries WHERE created < ?", (time.time() - self.ttl,)
+            ).fetchall():
+                self._drop(key)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._drop(key)
+            total -= size
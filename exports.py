@@ -0,0 +1,308 @@
+"""Report exports for the Examiner dashboard.
+
+Exports are built only when requested, written to disk as they are
+generated and kept in a ``DiskCache`` keyed by the version of the data
+they were built from. Downloading the same export again, from any session,
+is then a cache read until a new submission arrives or the exam changes.
+
+- ``results_csv``: every submission, streamed row by row into a CSV file.
+- ``results_pdf``: the submissions table. Past ``PDF_ROWS_PER_PART`` rows
+  it is split into several PDFs inside a ZIP, so no single FPDF document
+  (which FPDF keeps in memory) grows with the number of submissions.
+- ``answer_key_txt``: the answer key of the published exam.
+- ``student_reports_zip``: one detailed PDF per student, rendered in
+  parallel by a pool of worker processes.
+"""
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import metrics
+from disk_cache import DiskCache
+from grading import UNANSWERED, build_key, mark, unpack
+
+EXPORT_CACHE_DIR = os.path.join(os.getenv("BODHA_CACHE_DIR", ".bodha_cache"), "exports")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("BODHA_EXPORT_CACHE_MB", "256")) * 1024 * 1024
+# Worker processes rendering per-student reports; 1 renders them in-process.
+EXPORT_WORKERS = int(os.getenv("BODHA_EXPORT_WORKERS", "0")) or os.cpu_count() or 1
+PDF_ROWS_PER_PART = int(os.getenv("BODHA_PDF_ROWS_PER_PART", "5000"))
+# Student reports handed to a worker at a time.
+REPORTS_PER_TASK = 100
+# Bump when the layout of an export changes so stale cache entries are ignored.
+EXPORT_VERSION = 2
+
+_cache = None
+_cache_lock = threading.Lock()
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def get_export_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+        return _cache
+
+
+def export_key(kind, version):
+    payload = json.dumps([EXPORT_VERSION, kind, version], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cached_export(kind, version, build):
+    """Return the bytes of export ``kind`` for ``version``.
+
+    On a miss ``build(path)`` writes the export to a temporary file, which
+    is then moved into the cache. Pass the call to ``st.download_button``
+    wrapped in a callable, so the bytes are only read when it is clicked.
+    """
+    cache = get_export_cache()
+    key = export_key(kind, version)
+    data = cache.get(key)
+    if data is not None:
+        metrics.incr("export_cache_hits")
+        return data
+    fd, path = tempfile.mkstemp(prefix="bodha-export-")
+    os.close(fd)
+    try:
+        with metrics.timer(f"export_{kind}"):
+            build(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        cache.set_file(key, path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return data
+
+
+def _latin1(text):
+    # The core FPDF fonts only cover Latin-1.
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+
+def _percentage(score, total):
+    return (score / total) * 100 if total else 0.0
+
+
+# --- RESULTS ---
+def write_results_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Student Name", "Score", "Total", "Percentage", "Exam", "Exam Version", "Timestamp"])
+        for _, name, score, total, submitted_at, _, _, exam_id, exam_version in rows:
+            writer.writerow([
+                name, score, total, round(_percentage(score, total), 1), exam_id, exam_version or "", submitted_at
+            ])
+
+
+def write_results_pdf(rows, path, title="Student Assessment Submissions"):
+    # fpdf is imported on first export rather than by every process that
+    # imports this module.
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(190, 10, _latin1(title), ln=True, align="C")
+    pdf.ln(10)
+
+    # Table Header
+    pdf.set_font("Arial", "B", 10)
+    pdf.set_fill_color(200, 220, 255)
+    pdf.cell(50, 10, "Student Name", 1, 0, 'C', True)
+    pdf.cell(30, 10, "Score", 1, 0, 'C', True)
+    pdf.cell(30, 10, "Percentage", 1, 0, 'C', True)
+    pdf.cell(80, 10, "Timestamp", 1, 1, 'C', True)
+
+    # Table Body
+    pdf.set_font("Arial", "", 10)
+    for _, name, score, total, submitted_at, *_ in rows:
+        pdf.cell(50, 10, _latin1(name), 1)
+        pdf.cell(30, 10, f"{score}/{total}", 1, 0, 'C')
+        pdf.cell(30, 10, f"{_percentage(score, total):.1f}%", 1, 0, 'C')
+        pdf.cell(80, 10, _latin1(submitted_at), 1, 1, 'C')
+    pdf.output(path, "F")
+
+
+def results_pdf_format(count, rows_per_part=PDF_ROWS_PER_PART):
+    """``(file_name, mime)`` of the results PDF export for ``count`` submissions."""
+    if count > rows_per_part:
+        return "student_results.zip", "application/zip"
+    return "student_results.pdf", "application/pdf"
+
+
+def write_results_pdf_parts(rows, path, count, rows_per_part=PDF_ROWS_PER_PART,
+                            title="Student Assessment Submissions"):
+    """Write the results as one PDF, or as a ZIP of PDFs of ``rows_per_part`` rows each.
+
+    FPDF compresses its pages already, so the ZIP stores them as they are.
+    """
+    if count <= rows_per_part:
+        write_results_pdf(rows, path, title=title)
+        return
+    rows = iter(rows)
+    num_parts = -(-count // rows_per_part)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+        for part in itertools.count(1):
+            chunk = list(itertools.islice(rows, rows_per_part))
+            if not chunk:
+                break
+            fd, part_path = tempfile.mkstemp(suffix=".pdf")
+            os.close(fd)
+            try:
+                write_results_pdf(chunk, part_path, title=f"{title} ({part}/{num_parts})")
+                zf.write(part_path, f"student_results_part{part:03d}.pdf")
+            finally:
+                os.remove(part_path)
+
+
+def results_csv(store, exam_id=None):
+    version = (store.path, exam_id, store.version(exam_id))
+    return cached_export("results_csv", version, lambda path: write_results_csv(
+        store.iter_submissions(exam_id=exam_id), path
+    ))
+
+
+def results_pdf(store, count=None, exam_id=None):
+    """Results table (of ``exam_id``, default every exam) as a PDF or a ZIP of PDFs.
+
+    ``count`` decides which, as in ``results_pdf_format``; pass the count
+    the download's file name was chosen from, so a submission arriving in
+    between cannot turn a ``.pdf`` download into a ZIP.
+    """
+    version = store.version(exam_id)
+    count = version[2] if count is None else count
+    title = "Student Assessment Submissions" + (f" - {exam_id}" if exam_id else "")
+    key = (store.path, exam_id, version, PDF_ROWS_PER_PART, count)
+    return cached_export("results_pdf", key, lambda path: write_results_pdf_parts(
+        store.iter_submissions(exam_id=exam_id), path, count=count, title=title
+    ))
+
+
+# --- ANSWER KEY ---
+def answer_key_text(questions):
+    parts = ["ABAP Assessment AI - EXAM KEY\n" + "=" * 20 + "\n"]
+    parts.extend(f"Q{i}: {item['question']}\nAns: {item['answer']}\n\n" for i, item in enumerate(questions, 1))
+    return "".join(parts)
+
+
+def answer_key_txt(version, load_questions):
+    """Answer key for ``version`` (e.g. exam and bank versions); ``load_questions`` runs only on a miss."""
+    def build(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(answer_key_text(load_questions()))
+    return cached_export("answer_key", version, build)
+
+
+# --- DETAILED STUDENT REPORTS ---
+def _render_student_reports(out_dir, reports):
+    """Write one PDF per report into ``out_dir``; return the file names."""
+    from fpdf import FPDF
+
+    names = []
+    for report in reports:
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 16)
+        pdf.cell(190, 10, "ABAP Assessment RESULT", ln=True, align="C")
+        pdf.set_font("Arial", "", 11)
+        pdf.cell(190, 8, _latin1(f"Student: {report['name']}"), ln=True)
+        pdf.cell(190, 8, _latin1(f"Date: {report['submitted_at']}"), ln=True)
+        pdf.ln(4)
+        for i, (question, selected, answer, correct) in enumerate(report["items"], 1):
+            pdf.set_font("Arial", "B", 10)
+            pdf.multi_cell(190, 6, _latin1(f"Question {i}: {question}"))
+            pdf.set_font("Arial", "", 10)
+            pdf.multi_cell(190, 6, _latin1(f"Your Selection: {selected}"))
+            pdf.multi_cell(190, 6, _latin1(f"Correct Answer: {answer}"))
+            pdf.cell(190, 6, f"Result: {'CORRECT' if correct else 'INCORRECT'}", ln=True)
+            pdf.ln(2)
+        score, total = report["score"], report["total"]
+        pct = _percentage(score, total)
+        pdf.set_font("Arial", "B", 11)
+        pdf.cell(190, 8, f"Total Score: {score}/{total}  -  {pct:.1f}%  -  {'PASS' if pct >= 70 else 'FAIL'}", ln=True)
+        name = f"{report['id']:06d}_{_UNSAFE_NAME_RE.sub('_', report['name']).strip('_') or 'student'}.pdf"
+        pdf.output(os.path.join(out_dir, name), "F")
+        names.append(name)
+    return names
+
+
+def _report_batches(rows, bank, batch_size):
+    """Group submissions with stored answers into batches of report dicts."""
+    rows = (row for row in rows if row[6] is not None)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        vectors = [unpack(row[5], row[6]) for row in batch]
+        question_ids = sorted({int(q) for qids, _ in vectors for q in qids})
+        questions = {q["id"]: q for q in bank.get_questions(question_ids)}
+        key = build_key(list(questions.values()))
+        reports = []
+        for (row_id, name, score, total, submitted_at, *_), (qids, answers) in zip(batch, vectors):
+            correct = mark(qids, answers, key)
+            items = []
+            for qid, answer, ok in zip(qids.tolist(), answers.tolist(), correct.tolist()):
+                item = questions.get(qid, {"question": "(question removed)", "options": [], "answer": "?"})
+                options = item["options"]
+                selected = options[answer] if answer != UNANSWERED and 0 <= answer < len(options) else "(no answer)"
+                items.append((item["question"], selected, item["answer"], ok))
+            reports.append({
+                "id": row_id, "name": name, "score": score, "total": total,
+                "submitted_at": submitted_at, "items": items,
+            })
+        yield reports
+
+
+def write_student_reports_zip(rows, bank, path, workers=EXPORT_WORKERS):
+    """Zip one detailed PDF per stored submission.
+
+    Submissions stored before answers were recorded have nothing to report
+    and are skipped. At most two batches per worker are in flight, so
+    memory stays flat however many submissions there are.
+    """
+    out_dir = tempfile.mkdtemp(prefix="bodha-reports-")
+    batches = _report_batches(rows, bank, REPORTS_PER_TASK)
+    try:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+            def collect(names):
+                for name in names:
+                    file_path = os.path.join(out_dir, name)
+                    zf.write(file_path, name)
+                    os.remove(file_path)
+
+            if workers <= 1:
+                for reports in batches:
+                    collect(_render_student_reports(out_dir, reports))
+                return
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                pending = set()
+                for reports in batches:
+                    pending.add(pool.submit(_render_student_reports, out_dir, reports))
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future.result())
+                for future in pending:
+                    collect(future.result())
+    finally:
+        for name in os.listdir(out_dir):
+            os.remove(os.path.join(out_dir, name))
+        os.rmdir(out_dir)
+
+
+def student_reports_zip(store, bank, workers=EXPORT_WORKERS, exam_id=None):
+    version = (store.path, exam_id, store.version(exam_id), bank.path, bank.version())
+    return cached_export("student_reports", version, lambda path: write_student_reports_zip(
+        store.iter_submissions(exam_id=exam_id), bank, path, workers=workers
+    ))
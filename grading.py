@@ -0,0 +1,141 @@
+"""Vectorised grading of stored submissions.
+
+A submission is stored as two compact vectors: the bank ids of the
+questions on the student's paper (int32) and the index of the option the
+student picked for each (int8, ``UNANSWERED`` when blank). Grading every
+submission against an answer key is then a single NumPy comparison over
+the concatenated vectors, which makes re-grading the whole history after a
+key fix cheap.
+
+Run ``python grading.py --help`` for the re-grade and key-fix commands.
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+
+import metrics
+
+UNANSWERED = -1
+# Key value for a question whose answer matches none of its options.
+NO_KEY = -2
+
+_OPTION_LETTER_RE = re.compile(r'^([A-D])[\)\.\s]', re.IGNORECASE)
+
+
+def key_index(options, answer):
+    """Index of the option marked correct by ``answer`` (e.g. "B"), or ``NO_KEY``.
+
+    Mirrors the original rule: an option is correct when its text starts
+    with the answer letter or word.
+    """
+    answer = str(answer).strip().upper()
+    if not answer:
+        return NO_KEY
+    for i, option in enumerate(options):
+        if str(option).strip().upper().startswith(answer):
+            return i
+    return NO_KEY
+
+
+def answer_label(option):
+    """The answer string that marks ``option`` correct: its letter, or its text for True/False."""
+    match = _OPTION_LETTER_RE.match(str(option).strip())
+    return match.group(1).upper() if match else str(option).strip().upper()
+
+
+def pack(question_ids, answers):
+    """Encode one submission as ``(question_ids_blob, answers_blob)``."""
+    return (
+        np.asarray(question_ids, dtype=np.int32).tobytes(),
+        np.asarray([UNANSWERED if a is None else a for a in answers], dtype=np.int8).tobytes(),
+    )
+
+
+def unpack(question_ids_blob, answers_blob):
+    return np.frombuffer(question_ids_blob, dtype=np.int32), np.frombuffer(answers_blob, dtype=np.int8)
+
+
+def build_key(questions):
+    """Lookup array mapping bank id -> correct option index for ``questions``."""
+    if not questions:
+        return np.full(1, NO_KEY, dtype=np.int8)
+    key = np.full(max(q["id"] for q in questions) + 1, NO_KEY, dtype=np.int8)
+    for q in questions:
+        key[q["id"]] = key_index(q["options"], q["answer"])
+    return key
+
+
+def mark(question_ids, answers, key):
+    """Boolean vector telling which of one student's answers are correct."""
+    qids = np.asarray(question_ids, dtype=np.int64)
+    answers = np.asarray(answers, dtype=np.int8)
+    in_key = qids < len(key)
+    correct = np.zeros(len(qids), dtype=bool)
+    correct[in_key] = answers[in_key] == key[qids[in_key]]
+    return correct
+
+
+def grade(question_id_vectors, answer_vectors, key):
+    """Score every submission in one pass.
+
+    Returns an int array with the number of correct answers per
+    submission. Question ids missing from ``key`` never count as correct.
+    """
+    if not answer_vectors:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.fromiter((len(v) for v in answer_vectors), dtype=np.int64, count=len(answer_vectors))
+    correct = mark(np.concatenate(question_id_vectors), np.concatenate(answer_vectors), key)
+    owner = np.repeat(np.arange(len(answer_vectors)), lengths)
+    return np.bincount(owner, weights=correct, minlength=len(answer_vectors)).astype(np.int64)
+
+
+@metrics.timed("regrade")
+def regrade_all(store, bank, exam_id=None):
+    """Re-grade every stored submission (of ``exam_id``) against the bank's current key.
+
+    A bank question can appear in several exams, so a key fix should
+    re-grade them all (the default). Returns the number of submissions
+    whose score changed.
+    """
+    rows = store.answer_vectors(exam_id=exam_id)
+    if not rows:
+        return 0
+    vectors = [unpack(qids, answers) for _, _, qids, answers in rows]
+    question_ids = np.unique(np.concatenate([qids for qids, _ in vectors])).tolist()
+    key = build_key(bank.get_questions(question_ids))
+    scores = grade([qids for qids, _ in vectors], [answers for _, answers in vectors], key)
+    changed = [(row_id, int(score)) for (row_id, old, _, _), score in zip(rows, scores) if old != score]
+    if changed:
+        store.update_scores(changed)
+    return len(changed)
+
+
+def main(argv=None):
+    from question_bank import QuestionBank
+    from submission_store import SubmissionStore
+
+    # The same files the app uses, so a plain run re-grades the live data.
+    data_dir = os.getenv("BODHA_DATA_DIR", ".")
+    parser = argparse.ArgumentParser(description="Re-grade stored exam submissions.")
+    parser.add_argument("--results", default=os.path.join(data_dir, "student_submissions.db"), help="submissions database")
+    parser.add_argument("--bank", default=os.path.join(data_dir, "question_bank.db"), help="question bank database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    regrade = commands.add_parser("regrade", help="re-grade every submission against the current key")
+    regrade.add_argument("--exam", help="only re-grade the submissions of this exam id")
+    fix = commands.add_parser("fix-key", help="correct one answer in the bank, then re-grade")
+    fix.add_argument("question_id", type=int)
+    fix.add_argument("answer", help="correct option letter, e.g. B")
+    args = parser.parse_args(argv)
+
+    bank = QuestionBank(args.bank)
+    if args.command == "fix-key":
+        if not bank.update_answer(args.question_id, args.answer.strip().upper()):
+            parser.error(f"question {args.question_id} is not in the bank")
+    changed = regrade_all(SubmissionStore(args.results), bank, exam_id=getattr(args, "exam", None))
+    print(f"Re-graded submissions; {changed} score(s) changed.")
+
+
+if __name__ == "__main__":
+    main()
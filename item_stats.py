@@ -0,0 +1,146 @@
+"""Incremental item analysis of exam submissions.
+
+``ItemStats`` keeps running per-question sums in NumPy arrays indexed by
+bank id and only folds in submissions added since its last refresh, so a
+dashboard rerun costs the same with ten submissions or ten thousand. From
+those sums it derives the classical item statistics:
+
+- difficulty index: the share of attempts answered correctly;
+- discrimination: the point-biserial correlation between answering the
+  question correctly and the student's overall percentage;
+- distractor frequencies: how often each option was picked;
+- score distribution: a histogram of whole percentages, which also gives
+  the percentiles.
+"""
+import threading
+
+import numpy as np
+
+import metrics
+from grading import build_key, mark, unpack
+
+# Columns of the option-pick matrix; options beyond this are not counted.
+OPTION_SLOTS = 8
+PERCENTILES = (25, 50, 75, 90)
+
+
+class ItemStats:
+    """Running statistics of the submissions to one exam (``exam_id``), or to all of them."""
+
+    def __init__(self, exam_id=None):
+        self.exam_id = exam_id
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, generation):
+        self.generation = generation
+        self.last_id = 0
+        self.submissions = 0
+        self.score_hist = np.zeros(101, dtype=np.int64)
+        self.attempts = np.zeros(0, dtype=np.int64)
+        self.correct = np.zeros(0, dtype=np.int64)
+        # Sums of the overall fraction scored by the students who attempted each question.
+        self.score_sum = np.zeros(0)
+        self.score_sq_sum = np.zeros(0)
+        self.correct_score_sum = np.zeros(0)
+        self.choices = np.zeros((0, OPTION_SLOTS), dtype=np.int64)
+
+    def _grow(self, size):
+        pad = size - len(self.attempts)
+        if pad <= 0:
+            return
+        for name in ("attempts", "correct", "score_sum", "score_sq_sum", "correct_score_sum"):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros(pad, dtype=column.dtype)]))
+        self.choices = np.vstack([self.choices, np.zeros((pad, OPTION_SLOTS), dtype=np.int64)])
+
+    def refresh(self, store, bank):
+        """Fold in the submissions ``store`` gained since the last refresh."""
+        with self._lock:
+            # A key fix can flip per-question correctness without changing any
+            # total score, so the answer-key version is part of the cache key too.
+            # Publishing or importing questions leaves it alone.
+            generation = (store.generation(), bank.key_version())
+            if generation != self.generation:
+                # Rows were cleared or re-graded, or the key changed: start over from the first row.
+                self._reset(generation)
+            rows = store.submission_rows(after_id=self.last_id, exam_id=self.exam_id)
+            if rows:
+                with metrics.timer("item_stats_ingest", rows=len(rows)):
+                    self._ingest(rows, bank)
+                self.last_id = rows[-1][0]
+        return self
+
+    def _ingest(self, rows, bank):
+        scores = np.array([row[1] for row in rows], dtype=np.float64)
+        totals = np.array([row[2] for row in rows], dtype=np.float64)
+        fractions = np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+        self.submissions += len(rows)
+        self.score_hist += np.bincount(np.rint(fractions * 100).astype(np.int64).clip(0, 100), minlength=101)
+
+        # Legacy rows only carry a score, so they count towards the distribution alone.
+        with_answers = [i for i, row in enumerate(rows) if row[4] is not None]
+        if not with_answers:
+            return
+        vectors = [unpack(rows[i][3], rows[i][4]) for i in with_answers]
+        qids = np.concatenate([q for q, _ in vectors]).astype(np.int64)
+        answers = np.concatenate([a for _, a in vectors]).astype(np.int64)
+        if not len(qids):
+            return
+        owner_fraction = np.repeat(fractions[with_answers], [len(a) for _, a in vectors])
+        key = build_key(bank.get_questions(np.unique(qids).tolist()))
+        correct = mark(qids, answers, key)
+
+        self._grow(int(qids.max()) + 1)
+        size = len(self.attempts)
+        self.attempts += np.bincount(qids, minlength=size)
+        self.correct += np.bincount(qids, weights=correct, minlength=size).astype(np.int64)
+        self.score_sum += np.bincount(qids, weights=owner_fraction, minlength=size)
+        self.score_sq_sum += np.bincount(qids, weights=owner_fraction ** 2, minlength=size)
+        self.correct_score_sum += np.bincount(qids, weights=owner_fraction * correct, minlength=size)
+        picked = (answers >= 0) & (answers < OPTION_SLOTS)
+        np.add.at(self.choices, (qids[picked], answers[picked]), 1)
+
+    def items(self):
+        """Per-question statistics for every question attempted at least once.
+
+        Returns a dict of parallel arrays: ``question_id``, ``attempts``,
+        ``difficulty``, ``discrimination`` (NaN where it is undefined, e.g.
+        when everyone or no one answered correctly) and ``choices`` (one row
+        of option-pick counts per question).
+        """
+        with self._lock:
+            ids = np.flatnonzero(self.attempts)
+            n = self.attempts[ids].astype(np.float64)
+            c = self.correct[ids].astype(np.float64)
+            total = self.score_sum[ids]
+            correct_total = self.correct_score_sum[ids]
+            variance = self.score_sq_sum[ids] / n - (total / n) ** 2
+            choices = self.choices[ids].copy()
+        p = c / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_correct = correct_total / c
+            mean_incorrect = (total - correct_total) / (n - c)
+            discrimination = (mean_correct - mean_incorrect) / np.sqrt(variance) * np.sqrt(p * (1 - p))
+        discrimination[(c == 0) | (c == n) | (variance <= 1e-12)] = np.nan
+        return {
+            "question_id": ids,
+            "attempts": n.astype(np.int64),
+            "difficulty": p,
+            "discrimination": discrimination,
+            "choices": choices,
+        }
+
+    def summary(self, percentiles=PERCENTILES):
+        """Submission count, mean percentage, percentiles and the score histogram."""
+        with self._lock:
+            hist = self.score_hist.copy()
+            count = self.submissions
+        result = {"submissions": count, "mean": None, "percentiles": {}, "histogram": hist}
+        if count:
+            cumulative = np.cumsum(hist)
+            result["mean"] = float((hist * np.arange(101)).sum() / count)
+            result["percentiles"] = {
+                q: int(np.searchsorted(cumulative, q / 100 * count)) for q in percentiles
+            }
+        return result
@@ -0,0 +1,249 @@
+"""Persistent background jobs.
+
+Long-running work such as publishing an exam is queued as a row in an
+SQLite table and executed by worker threads, so the Streamlit script run
+that submitted it returns at once and the work carries on when the
+examiner navigates away. Handlers report progress and checkpoint partial
+results into their job row; the dashboard only ever reads job rows.
+
+Every queue keeps the heartbeat of the jobs it runs fresh. A running job
+whose heartbeat is older than ``STALE_SECONDS`` belonged to a process that
+died, so it is queued again and its handler receives the last checkpoint,
+resuming rather than starting over.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = os.getenv("BODHA_JOB_DIR", ".bodha_jobs")
+JOB_WORKERS = int(os.getenv("BODHA_JOB_WORKERS", "1"))
+STALE_SECONDS = float(os.getenv("BODHA_JOB_STALE_SECONDS", "120"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    checkpoint TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+_COLUMNS = "id, kind, params, status, done, total, checkpoint, result, error, created_at, updated_at"
+
+Job = namedtuple("Job", _COLUMNS.replace(",", "").split())
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _job(row):
+    row = list(row)
+    for i in (2, 6, 7):
+        row[i] = json.loads(row[i]) if row[i] is not None else None
+    return Job(*row)
+
+
+class JobContext:
+    """What a handler sees of its job: parameters, last checkpoint and a progress hook."""
+
+    def __init__(self, queue, job, stop):
+        self.id = job.id
+        self.params = job.params
+        self.checkpoint = job.checkpoint
+        # Set when the job is cancelled; long loops can wait on it directly.
+        self.stop = stop
+        self._queue = queue
+
+    def progress(self, done, total, checkpoint=None):
+        """Record progress, plus a resumable ``checkpoint`` (any JSON value) if given."""
+        if self._queue._progress(self.id, done, total, checkpoint):
+            self.stop.set()
+
+    def cancelled(self):
+        return self.stop.is_set()
+
+    def raise_if_cancelled(self):
+        if self.stop.is_set():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """SQLite-backed job queue drained by ``workers`` daemon threads.
+
+    ``handlers`` maps a job kind to ``handler(context)``, whose return
+    value (any JSON value) becomes the job result. Raising ``JobCancelled``
+    marks the job cancelled; any other exception marks it failed.
+    """
+
+    def __init__(self, path, handlers, workers=JOB_WORKERS, poll_interval=1.0):
+        self.path = path
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(SCHEMA)
+        self._wake = threading.Event()
+        self._stops = {}
+        self._requeue_stale()
+        self._threads = [
+            threading.Thread(target=self._work_loop, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    # --- CLIENT API ---
+    def submit(self, kind, params):
+        """Queue a job and return its id."""
+        if kind not in self.handlers:
+            raise ValueError(f"unknown job kind: {kind}")
+        now = _now()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (kind, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(params), QUEUED, now, now),
+            )
+        self._wake.set()
+        return cur.lastrowid
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def recent(self, limit=10):
+        """The ``limit`` most recently submitted jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [_job(row) for row in rows]
+
+    def has_active(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", ACTIVE_STATUSES
+            ).fetchone() is not None
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, or ask a running one to stop."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, _now(), job_id, QUEUED),
+            )
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+            self._conn.execute("COMMIT")
+            stop = self._stops.get(job_id)
+        if stop is not None:
+            stop.set()
+
+    # --- WORKERS ---
+    def _requeue_stale(self):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND heartbeat < ?",
+                (QUEUED, _now(), RUNNING, time.time() - STALE_SECONDS),
+            )
+        if cur.rowcount:
+            logger.info("Resuming %d interrupted job(s)", cur.rowcount)
+            self._wake.set()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(STALE_SECONDS / 4)
+            with self._lock:
+                running = list(self._stops)
+                if running:
+                    placeholders = ",".join("?" * len(running))
+                    self._conn.execute(
+                        f"UPDATE jobs SET heartbeat = ? WHERE id IN ({placeholders})", [time.time(), *running]
+                    )
+            self._requeue_stale()
+
+    def _claim(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, time.time(), _now(), row[0]),
+                )
+            self._conn.execute("COMMIT")
+        return _job(row) if row else None
+
+    def _progress(self, job_id, done, total, checkpoint):
+        """Store progress; return whether a cancel has been requested."""
+        with self._lock:
+            if checkpoint is None:
+                self._conn.execute(
+                    "UPDATE jobs SET done = ?, total = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                    (done, total, time.time(), _now(), job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET done = ?, total = ?, checkpoint = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                    (done, total, json.dumps(checkpoint), time.time(), _now(), job_id),
+                )
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, _now(), job_id),
+            )
+            self._stops.pop(job_id, None)
+
+    def _work_loop(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                # Jobs submitted by this process wake us up; polling catches the rest.
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            stop = threading.Event()
+            with self._lock:
+                self._stops[job.id] = stop
+            try:
+                with metrics.timer(f"job_{job.kind}"):
+                    result = self.handlers[job.kind](JobContext(self, job, stop))
+            except JobCancelled:
+                self._finish(job.id, CANCELLED)
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job.id, job.kind)
+                self._finish(job.id, FAILED, error=str(e))
+            else:
+                self._finish(job.id, DONE, result=result)
@@ -0,0 +1,190 @@
+"""Lightweight timing and counter instrumentation.
+
+Hot paths wrap their stages in ``timer(name)`` (or report a duration they
+measured themselves with ``observe_time``), report sizes and ratios
+with ``observe(name, value)`` and count events with ``incr(name)``. Every
+metric keeps process-wide totals plus a window of its most recent samples,
+from which the Examiner dashboard shows p50/p95.
+
+Samples are also queued as JSON lines for ``METRICS_LOG``, and a
+Prometheus text-format snapshot is rewritten to ``METRICS_PROM`` (e.g. for
+node_exporter's textfile collector). Both files are written by a
+background thread every ``FLUSH_SECONDS``, never on the hot path. Set
+``BODHA_METRICS=0`` to turn instrumentation off.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+METRICS_ENABLED = os.getenv("BODHA_METRICS", "1") != "0"
+METRICS_DIR = os.getenv("BODHA_METRICS_DIR", ".bodha_metrics")
+METRICS_LOG = os.path.join(METRICS_DIR, "metrics.jsonl")
+METRICS_PROM = os.path.join(METRICS_DIR, "metrics.prom")
+# The JSON log is rotated to ``metrics.jsonl.1`` past this size.
+METRICS_LOG_MAX_BYTES = int(os.getenv("BODHA_METRICS_LOG_MB", "32")) * 1024 * 1024
+RECENT_SAMPLES = 512
+FLUSH_SECONDS = 5.0
+
+TIMER, VALUE, COUNTER = "timer", "value", "counter"
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class _Metric:
+    __slots__ = ("kind", "count", "total", "last", "recent")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+
+class Registry:
+    def __init__(self, log_path=METRICS_LOG, prom_path=METRICS_PROM, enabled=METRICS_ENABLED):
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._pending = []
+        self._flusher = None
+
+    # --- RECORDING ---
+    def record(self, name, value, kind, **fields):
+        if not self.enabled:
+            return
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = _Metric(kind)
+            metric.count += 1
+            metric.total += value
+            metric.last = value
+            if kind != COUNTER:
+                metric.recent.append(value)
+            self._pending.append({"ts": time.time(), "metric": name, "kind": kind, "value": value, **fields})
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def observe(self, name, value, **fields):
+        self.record(name, float(value), VALUE, **fields)
+
+    def incr(self, name, n=1, **fields):
+        self.record(name, n, COUNTER, **fields)
+
+    def observe_time(self, name, seconds, **fields):
+        """Record a duration measured by the caller, e.g. across a generator."""
+        self.record(name, seconds, TIMER, **fields)
+
+    @contextlib.contextmanager
+    def timer(self, name, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, TIMER, **fields)
+
+    # --- READING ---
+    def snapshot(self):
+        """One dict per metric with its totals and recent p50/p95, sorted by name."""
+        with self._lock:
+            items = [(name, m.kind, m.count, m.total, m.last, sorted(m.recent)) for name, m in self._metrics.items()]
+        return [
+            {
+                "name": name, "kind": kind, "count": count, "total": total, "last": last,
+                "p50": percentile(recent, 50), "p95": percentile(recent, 95),
+            }
+            for name, kind, count, total, last, recent in sorted(items)
+        ]
+
+    def prometheus_text(self):
+        lines = []
+        for m in self.snapshot():
+            if m["kind"] == COUNTER:
+                metric = f"bodha_{m['name']}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {m['total']:g}"]
+                continue
+            metric = f"bodha_{m['name']}_seconds" if m["kind"] == TIMER else f"bodha_{m['name']}"
+            lines.append(f"# TYPE {metric} summary")
+            for q in (50, 95):
+                lines.append(f'{metric}{{quantile="{q / 100:g}"}} {m[f"p{q}"]:g}')
+            lines += [f"{metric}_sum {m['total']:g}", f"{metric}_count {m['count']}"]
+        return "\n".join(lines) + "\n"
+
+    # --- SINKS ---
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending and os.path.exists(self.prom_path):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        if pending:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > METRICS_LOG_MAX_BYTES:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(event) + "\n" for event in pending))
+        directory = os.path.dirname(os.path.abspath(self.prom_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.prom_path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+_registry = Registry()
+
+
+def get_registry():
+    return _registry
+
+
+def timer(name, **fields):
+    return _registry.timer(name, **fields)
+
+
+def observe(name, value, **fields):
+    _registry.observe(name, value, **fields)
+
+
+def incr(name, n=1, **fields):
+    _registry.incr(name, n, **fields)
+
+
+def observe_time(name, seconds, **fields):
+    _registry.observe_time(name, seconds, **fields)
+
+
+def timed(name):
+    """Decorator form of ``timer``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _registry.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,211 @@
+"""Text extraction from uploaded exam PDFs.
+
+Uploads are spooled to disk in chunks and read page by page: each page's
+parsed layout is released once its text has been read, and the document
+is reopened whenever the parser's own caches grow past
+``PDF_MEMORY_LIMIT_MB``. ``extract_chapters_from_pdf`` returns the whole
+text (in parallel for large documents); ``stream_pdf_pages`` yields it one
+page at a time for callers that can consume it as a stream.
+"""
+import gc
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from disk_cache import DiskCache, file_digest
+
+PDF_CACHE_DIR = os.path.join(os.getenv("BODHA_CACHE_DIR", ".bodha_cache"), "pdf_text")
+PDF_CACHE_MAX_BYTES = int(os.getenv("BODHA_PDF_CACHE_MB", "512")) * 1024 * 1024
+# Worker processes used for page-level extraction; 1 disables parallelism.
+PDF_WORKERS = int(os.getenv("BODHA_PDF_WORKERS", "0")) or os.cpu_count() or 1
+# Below this many pages the process pool start-up costs more than it saves.
+PARALLEL_MIN_PAGES = int(os.getenv("BODHA_PARALLEL_MIN_PAGES", "24"))
+# How far the process may grow while reading one document before the
+# parser's caches are dropped by reopening it; 0 disables the check.
+PDF_MEMORY_LIMIT_MB = int(os.getenv("BODHA_PDF_MEMORY_MB", "256"))
+# Whether the Examiner dashboard extracts page by page by default.
+PDF_STREAMING = os.getenv("BODHA_PDF_STREAMING", "0") == "1"
+# Bump when the extraction output changes so stale cache entries are ignored.
+EXTRACT_VERSION = 2
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+        return _cache
+
+
+def spool_upload(uploaded_file, suffix=".pdf", chunk_size=1024 * 1024, directory=None):
+    """Copy an uploaded file to a temporary file on disk in fixed-size chunks."""
+    uploaded_file.seek(0)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp:
+        shutil.copyfileobj(uploaded_file, tmp, chunk_size)
+        return tmp.name
+
+
+def clean_text(text):
+    return re.sub(r'\n+', '\n', text).strip()
+
+
+def resident_bytes():
+    """Current resident memory of this process, or ``None`` where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def iter_page_texts(file_path, start=0, stop=None, memory_limit_mb=PDF_MEMORY_LIMIT_MB):
+    """Yield the cleaned text of every page in ``[start, stop)``, in order.
+
+    Pages are numbered from 0 and ``stop=None`` reads to the end; pages
+    without text yield ``""``. Each page's layout objects are released as
+    soon as its text is read. When the process has grown by more than
+    ``memory_limit_mb`` since the document was opened, it is closed and
+    reopened at the next page, which drops pdfminer's document-wide object
+    cache as well. The check is skipped where resident memory cannot be
+    read (``/proc`` is Linux only).
+    """
+    # pdfplumber is only imported once a PDF is actually read; the student
+    # view imports this module but never extracts anything.
+    import pdfplumber
+
+    limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+    page_no = start
+    while stop is None or page_no < stop:
+        # ``pages`` limits the Page objects pdfplumber builds to the range still to read.
+        wanted = range(page_no + 1, stop + 1 if stop is not None else sys.maxsize)
+        with pdfplumber.open(file_path, pages=wanted) as pdf:
+            baseline = resident_bytes() if limit else None
+            reopen = False
+            for page in pdf.pages:
+                text = page.extract_text() or ""
+                page.close()
+                page_no += 1
+                yield clean_text(text)
+                if baseline is not None and resident_bytes() - baseline > limit:
+                    reopen = True
+                    break
+        if not reopen:
+            return
+        gc.collect()
+
+
+def _extract_page_range(file_path, start, stop, memory_limit_mb=PDF_MEMORY_LIMIT_MB):
+    return list(iter_page_texts(file_path, start, stop, memory_limit_mb))
+
+
+def split_page_ranges(num_pages, workers):
+    # A few ranges per worker keeps the pool busy when some pages are heavier.
+    num_ranges = min(num_pages, workers * 4)
+    step, extra = divmod(num_pages, num_ranges)
+    ranges, start = [], 0
+    for i in range(num_ranges):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def page_count(file_path):
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_text(file_path, workers, start=0, stop=None, memory_limit_mb=PDF_MEMORY_LIMIT_MB):
+    total = page_count(file_path)
+    stop = total if stop is None else min(stop, total)
+    num_pages = max(stop - start, 0)
+    if workers <= 1 or num_pages < PARALLEL_MIN_PAGES:
+        page_texts = _extract_page_range(file_path, start, stop, memory_limit_mb)
+    else:
+        ranges = split_page_ranges(num_pages, workers)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_extract_page_range, file_path, start + a, start + b, memory_limit_mb)
+                for a, b in ranges
+            ]
+            page_texts = [text for future in futures for text in future.result()]
+    return "\n".join(text for text in page_texts if text)
+
+
+def _cache_key(file_path, start, stop):
+    key = f"{file_digest(file_path)}-v{EXTRACT_VERSION}"
+    if start or stop is not None:
+        key += f"-p{start}-{'' if stop is None else stop}"
+    return key
+
+
+def extract_chapters_from_pdf(file_path, workers=None, start=0, stop=None, memory_limit_mb=PDF_MEMORY_LIMIT_MB):
+    """Extract the cleaned text of a PDF, cached by a hash of its content.
+
+    Uploading the same document again only costs the hash computation.
+    Large documents are split into page ranges and extracted by a pool of
+    ``workers`` processes (default ``PDF_WORKERS``); small ones are read
+    serially. ``start`` and ``stop`` select a page range as in
+    ``iter_page_texts``.
+    """
+    with metrics.timer("pdf_extract"):
+        cache = get_pdf_cache()
+        key = _cache_key(file_path, start, stop)
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.incr("pdf_cache_hits")
+            return cached.decode("utf-8")
+        metrics.incr("pdf_cache_misses")
+        text = _extract_text(file_path, PDF_WORKERS if workers is None else workers, start, stop, memory_limit_mb)
+        cache.set(key, text.encode("utf-8"))
+        return text
+
+
+def stream_pdf_pages(file_path, start=0, stop=None, memory_limit_mb=PDF_MEMORY_LIMIT_MB):
+    """Yield the text of a PDF page by page without ever holding all of it.
+
+    Produces the same text as ``extract_chapters_from_pdf`` (the non-empty
+    pages, to be joined with newlines) and shares its cache. A cached
+    document is yielded as a single piece; otherwise pages are read serially
+    with ``iter_page_texts`` and appended to a cache file as they go, which
+    enters the cache only once the whole range has been read.
+    """
+    cache = get_pdf_cache()
+    key = _cache_key(file_path, start, stop)
+    cached = cache.get(key)
+    if cached is not None:
+        metrics.incr("pdf_cache_hits")
+        yield cached.decode("utf-8")
+        return
+    metrics.incr("pdf_cache_misses")
+    started = time.perf_counter()
+    fd, tmp_path = tempfile.mkstemp(dir=cache.root, prefix=".stream-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            separator = ""
+            for text in iter_page_texts(file_path, start, stop, memory_limit_mb):
+                if not text:
+                    continue
+                f.write(separator + text)
+                separator = "\n"
+                yield text
+        cache.set_file(key, tmp_path)
+        metrics.observe_time("pdf_extract", time.perf_counter() - started, streamed=True)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,106 @@
+"""Background job handlers that turn an uploaded PDF into a published exam.
+
+Both handlers run on a ``jobs.JobQueue`` worker thread and take their
+settings from the job parameters submitted by the Examiner dashboard. The
+upload is spooled into ``UPLOAD_DIR`` so that it outlives the script run
+that received it; it is removed once the job ends.
+"""
+import os
+from pathlib import Path
+
+from jobs import JOB_DIR
+from pdf_extract import PDF_MEMORY_LIMIT_MB, extract_chapters_from_pdf, stream_pdf_pages
+from question_gen import generate_quiz, get_llm_cache
+from storage import DEFAULT_EXAM
+from table_import import import_table_pdf
+
+UPLOAD_DIR = os.path.join(JOB_DIR, "uploads")
+
+
+def publish_questions(questions, params, bank, exams):
+    """Add ``questions`` to ``bank`` and publish them as the next version of the job's exam."""
+    topic = params["topic"] or Path(params["file_name"]).stem
+    facets = {"topic": topic, "difficulty": params["difficulty"], "q_type": params["q_type"], "source": params["file_name"]}
+    added = bank.add_questions(questions, **facets)
+    question_ids = bank.ids_for(questions, **facets)
+    exam_id = params.get("exam_id", DEFAULT_EXAM)
+    version = exams.publish(exam_id, [{**item, "id": qid} for item, qid in zip(questions, question_ids)])
+    return {"published": len(questions), "added_to_bank": added, "exam_id": exam_id, "exam_version": version}
+
+
+def _remove_upload(params):
+    try:
+        os.remove(params["file_path"])
+    except FileNotFoundError:
+        pass
+
+
+def _document_text(ctx):
+    """The uploaded document's text, or a stream of its pages in streaming mode."""
+    params = ctx.params
+    pages = {
+        "start": params.get("page_start", 0),
+        "stop": params.get("page_stop"),
+        "memory_limit_mb": params.get("pdf_memory_mb", PDF_MEMORY_LIMIT_MB),
+    }
+    if not params.get("stream_pdf"):
+        return extract_chapters_from_pdf(params["file_path"], workers=params["pdf_workers"], **pages)
+
+    def cancellable():
+        for text in stream_pdf_pages(params["file_path"], **pages):
+            ctx.raise_if_cancelled()
+            yield text
+    return cancellable()
+
+
+def run_generation_job(ctx, client, bank, exams):
+    """Generate questions from the uploaded PDF with the model, then publish them.
+
+    Every accepted question is checkpointed, so a resumed job only asks the
+    model for the questions still missing. With ``stream_pdf`` set, pages are
+    extracted one at a time and indexed as they are read.
+    """
+    params = ctx.params
+    num_q = params["num_q"]
+    try:
+        ctx.progress(0, num_q)
+        text = _document_text(ctx)
+        ctx.raise_if_cancelled()
+        questions, errors = generate_quiz(
+            text, params["difficulty"], num_q, params["q_type"],
+            client=client, max_concurrency=params["llm_concurrency"], topic=params["topic"] or None,
+            use_cache=params["use_cache"], fresh=params["fresh"], dedup_threshold=params["dedup_threshold"],
+            resume=ctx.checkpoint, stop=ctx.stop,
+            on_checkpoint=lambda state: ctx.progress(len(state["questions"]), num_q, state),
+        )
+        ctx.raise_if_cancelled()
+        result = {"errors": errors, "published": 0}
+        if questions:
+            result.update(publish_questions(questions[:num_q], params, bank, exams))
+        if params["use_cache"]:
+            result["cache"] = get_llm_cache().stats()
+        return result
+    finally:
+        _remove_upload(params)
+
+
+def run_import_job(ctx, bank, exams):
+    """Import a table-format question bank PDF and publish it as is.
+
+    The import reads pages in parallel and is cheap to repeat, so an
+    interrupted import simply starts again.
+    """
+    params = ctx.params
+    try:
+        ctx.progress(0, 1)
+        questions, row_errors = import_table_pdf(
+            params["file_path"], workers=params["pdf_workers"], dedup_threshold=params["dedup_threshold"]
+        )
+        ctx.raise_if_cancelled()
+        result = {"imported": len(questions), "errors": [e._asdict() for e in row_errors], "published": 0}
+        if questions:
+            result.update(publish_questions(questions, params, bank, exams))
+        ctx.progress(1, 1)
+        return result
+    finally:
+        _remove_upload(params)
@@ -0,0 +1,236 @@
+"""Persistent question bank.
+
+Every imported question is kept in an SQLite table together with its
+topic, difficulty and type, independently of the exam currently published.
+Questions are identified by a fingerprint of their normalised text, their
+options and their answer, so importing the same bank twice does not create
+duplicates, while a question republished with reordered options or a
+different answer gets a row (and a key) of its own.
+
+Exams can also be assembled per student by sampling from the bank. The ids
+matching a (topic, difficulty, type) filter are read once through a
+covering index and kept in memory until the bank changes, so drawing a
+paper costs one seeded ``random.sample`` plus a primary-key lookup per
+question, however large the bank grows.
+"""
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from dedup_index import normalize_question
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    q_type TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fingerprint TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_questions_facets ON questions (topic, difficulty, q_type, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('key_version', 0);
+"""
+FACETS = ("topic", "difficulty", "q_type")
+
+
+# Bump when ``fingerprint`` changes; existing rows are re-fingerprinted on open.
+FINGERPRINT_VERSION = 2
+
+
+def fingerprint(item):
+    """Identity of a question: its normalised stem plus its exact options and answer."""
+    parts = [normalize_question(item["question"])]
+    parts += [" ".join(str(option).split()) for option in item["options"]]
+    parts.append(str(item["answer"]).strip().upper())
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def student_seed(exam_seed, student_name):
+    """Deterministic sampling seed for one student's paper of one exam."""
+    key = f"{exam_seed}:{' '.join(student_name.lower().split())}"
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+class QuestionBank:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(SCHEMA)
+        self._migrate_fingerprints()
+        self._id_cache = {}
+
+    def _migrate_fingerprints(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'fingerprint_version'").fetchone()
+            if row is None or row[0] < FINGERPRINT_VERSION:
+                rows = self._conn.execute("SELECT id, question, options, answer FROM questions").fetchall()
+                self._conn.executemany(
+                    "UPDATE questions SET fingerprint = ? WHERE id = ?",
+                    [
+                        (fingerprint({"question": q, "options": json.loads(options), "answer": answer}), qid)
+                        for qid, q, options, answer in rows
+                    ],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint_version', ?)", (FINGERPRINT_VERSION,)
+                )
+            self._conn.execute("COMMIT")
+
+    def add_questions(self, questions, topic, difficulty, q_type, source=""):
+        """Insert questions not already in the bank; return how many were added."""
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (item["question"], json.dumps(item["options"]), item["answer"], topic, difficulty, q_type,
+             source, fingerprint(item), created_at)
+            for item in questions
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (question, options, answer, topic, difficulty, q_type, "
+                "source, fingerprint, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = self._conn.total_changes - before
+            if added:
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self._conn.execute("COMMIT")
+            return added
+
+    def ids_for(self, questions, topic="Uncategorized", difficulty="Unknown", q_type="Unknown", source=""):
+        """Bank ids of ``questions`` in order, adding any the bank does not hold yet."""
+        prints = [fingerprint(item) for item in questions]
+        lookup = self._ids_by_fingerprint(prints)
+        missing = [item for item, fp in zip(questions, prints) if fp not in lookup]
+        if missing:
+            self.add_questions(missing, topic, difficulty, q_type, source)
+            lookup = self._ids_by_fingerprint(prints)
+        return [lookup[fp] for fp in prints]
+
+    def find_ids(self, questions):
+        """Bank ids of ``questions`` in order, ``None`` for any the bank does not hold."""
+        prints = [fingerprint(item) for item in questions]
+        lookup = self._ids_by_fingerprint(prints)
+        return [lookup.get(fp) for fp in prints]
+
+    def _ids_by_fingerprint(self, prints):
+        found = {}
+        with self._lock:
+            for start in range(0, len(prints), 500):
+                chunk = prints[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT fingerprint, id FROM questions WHERE fingerprint IN ({placeholders})", chunk
+                ).fetchall())
+        return found
+
+    def update_answer(self, question_id, answer):
+        """Correct the stored answer of one question; return whether it existed.
+
+        The fingerprint keeps the answer the question was published with, so
+        exams that still carry the old answer resolve to the corrected row.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cur = self._conn.execute("UPDATE questions SET answer = ? WHERE id = ?", (answer, question_id))
+            if cur.rowcount:
+                # Answer keys cached by bank version must be rebuilt.
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key IN ('version', 'key_version')")
+            self._conn.execute("COMMIT")
+            return cur.rowcount > 0
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def key_version(self):
+        """Counter bumped only when a stored answer changes, not when questions are added."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'key_version'").fetchone()[0]
+
+    def facet_values(self, facet):
+        if facet not in FACETS:
+            raise ValueError(f"unknown facet: {facet}")
+        with self._lock:
+            return [r[0] for r in self._conn.execute(f"SELECT DISTINCT {facet} FROM questions ORDER BY 1")]
+
+    def question_ids(self, topic=None, difficulty=None, q_type=None):
+        """Ids of the questions matching the given filters (``None`` matches all)."""
+        filters = {"topic": topic, "difficulty": difficulty, "q_type": q_type}
+        key = (self.version(), topic, difficulty, q_type)
+        ids = self._id_cache.get(key)
+        if ids is None:
+            clauses = [f"{facet} = ?" for facet, value in filters.items() if value is not None]
+            params = [value for value in filters.values() if value is not None]
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            with self._lock:
+                ids = tuple(r[0] for r in self._conn.execute(f"SELECT id FROM questions {where} ORDER BY id", params))
+            # Entries for older versions can never be hit again.
+            self._id_cache = {k: v for k, v in self._id_cache.items() if k[0] == key[0]}
+            self._id_cache[key] = ids
+        return ids
+
+    def search(self, text, within=None, limit=50):
+        """Ids of up to ``limit`` questions whose text contains ``text``, ignoring case.
+
+        ``within`` restricts the result to a set of ids, such as the pool
+        of a published exam.
+        """
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        found = []
+        with self._lock:
+            for (qid,) in self._conn.execute(
+                "SELECT id FROM questions WHERE question LIKE ? ESCAPE '\\' ORDER BY id", (pattern,)
+            ):
+                if within is None or qid in within:
+                    found.append(qid)
+                    if len(found) == limit:
+                        break
+        return found
+
+    def get_questions(self, ids):
+        """Fetch questions by id, in the order given, as exam question dicts."""
+        found = {}
+        ids = list(ids)
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for row in self._conn.execute(
+                    f"SELECT id, question, options, answer FROM questions WHERE id IN ({placeholders})", chunk
+                ):
+                    found[row[0]] = {"id": row[0], "question": row[1], "options": json.loads(row[2]), "answer": row[3]}
+        return [found[i] for i in ids if i in found]
+
+    def sample_exam(self, seed, count, topic=None, difficulty=None, q_type=None, pool=None):
+        """Draw a reproducible paper of up to ``count`` questions for ``seed``.
+
+        ``pool`` is the list of ids frozen into a published exam. Without it
+        the paper is drawn from the questions matching the filters now, which
+        changes as questions are added.
+        """
+        ids = list(pool) if pool is not None else self.question_ids(topic, difficulty, q_type)
+        picked = random.Random(seed).sample(ids, min(count, len(ids)))
+        return self.get_questions(picked)
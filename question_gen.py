@@ -0,0 +1,347 @@
+"""LLM question generation.
+
+Model access goes through a small client interface (``generate(prompt)``
+returning text and ``generate_stream(prompt)`` yielding text chunks) so the
+Gemini client can be swapped for ``FakeClient`` to run the whole generation
+path offline.
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from dedup_index import DEDUP_THRESHOLD, NearDuplicateIndex
+from disk_cache import DiskCache
+from question_parser import StreamingQuestionParser
+from text_index import CONTEXT_CHARS, BM25Index, build_index, chunk_pages, document_hash
+
+MODEL_NAME = "gemini-2.5-flash"
+BATCH_SIZE = 15
+MAX_CONCURRENCY = int(os.getenv("BODHA_LLM_CONCURRENCY", "4"))
+MAX_RETRIES = 3
+# Floor for the observed parse-and-dedup yield used to size follow-up batches.
+MIN_EXPECTED_YIELD = 0.3
+BACKOFF_SECONDS = 1.0
+# Hard cap on the document text placed in a single prompt.
+MAX_PROMPT_TEXT = 15000
+
+# Response caching is opt-in: identical requests are answered from disk.
+LLM_CACHE_ENABLED = os.getenv("BODHA_LLM_CACHE") == "1"
+LLM_CACHE_DIR = os.path.join(os.getenv("BODHA_CACHE_DIR", ".bodha_cache"), "llm_responses")
+LLM_CACHE_MAX_BYTES = int(os.getenv("BODHA_LLM_CACHE_MB", "256")) * 1024 * 1024
+LLM_CACHE_TTL = float(os.getenv("BODHA_LLM_CACHE_TTL_HOURS", "168")) * 3600
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL)
+        return _llm_cache
+
+
+# --- MODEL CLIENTS ---
+class GeminiClient:
+    def __init__(self, model_name=MODEL_NAME, api_key=None):
+        # Imported here so that processes which never call the model (e.g.
+        # the student view) do not pay for loading the SDK.
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def generate_stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class FakeClient:
+    """Offline client that answers every prompt from a question template.
+
+    ``template`` is formatted with ``n``, a counter that is unique across
+    calls, and ``subject``, a pseudo-random phrase derived from ``n``, so
+    successive questions are distinct enough to pass deduplication. A
+    template may hold several questions (``questions_per_template``), e.g.
+    one good and one malformed, to model a lossy response.
+    """
+
+    DEFAULT_TEMPLATE = (
+        "Q: Which statement describes {subject}?\n"
+        "A) First option\nB) Second option\nC) Third option\nD) Fourth option\n"
+        "Answer: A\n"
+    )
+    VOCABULARY = (
+        "abap hana cds view amdp association annotation buffer cursor database dictionary domain "
+        "element entity field function group index internal join key lock loop method module "
+        "object package parameter procedure projection query report runtime schema select "
+        "session structure table transaction transport type update variant workflow"
+    ).split()
+
+    def __init__(self, latency=0.0, template=DEFAULT_TEMPLATE, questions_per_template=1):
+        self.model_name = "fake"
+        self.latency = latency
+        self.template = template
+        self.questions_per_template = questions_per_template
+        # Questions asked for over all calls.
+        self.requested = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _subject(self, n):
+        return " ".join(random.Random(n).sample(self.VOCABULARY, 6))
+
+    def generate(self, prompt):
+        return "".join(self.generate_stream(prompt))
+
+    def generate_stream(self, prompt):
+        # ``latency`` is spread evenly over the questions of the batch.
+        match = re.search(r"EXACTLY (\d+)", prompt)
+        num = int(match.group(1)) if match else 1
+        with self._lock:
+            self.requested += num
+            numbers = [next(self._counter) for _ in range(-(-num // self.questions_per_template))]
+        for n in numbers:
+            time.sleep(self.latency / len(numbers))
+            yield self.template.format(n=n, subject=self._subject(n)) + "\n"
+
+
+# --- SINGLE BATCH ---
+def build_prompt(text, difficulty, num, q_type, topic=None):
+    focus = f" Focus on the topic: {topic}." if topic else ""
+    # Updated prompt to enforce the number of questions strictly
+    return f"""You are an expert examiner. Generate EXACTLY {num} {difficulty} level {q_type} questions based on the text below.{focus}
+
+    STRICT RULES:
+    1. You must output exactly {num} questions.
+    2. Use this format for every single question:
+       Q: [Question text]
+       A) [Option]
+       B) [Option]
+       C) [Option]
+       D) [Option]
+       Answer: [Correct Letter Only]
+
+    TEXT:
+    {text[:MAX_PROMPT_TEXT]}"""
+
+
+def _backoff(attempt, backoff=BACKOFF_SECONDS):
+    # Exponential backoff with jitter so parallel batches don't retry in lockstep.
+    time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+def response_cache_key(model_name, doc_hash, text, difficulty, q_type, num, topic, variant):
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    parts = [model_name, doc_hash, text_hash, difficulty, q_type, num, topic, variant]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def _cache_slot(client, use_cache, doc_hash, text, difficulty, q_type, num, topic, variant):
+    use_cache = LLM_CACHE_ENABLED if use_cache is None else use_cache
+    if not use_cache:
+        return None, None
+    return get_llm_cache(), response_cache_key(client.model_name, doc_hash, text, difficulty, q_type, num, topic, variant)
+
+
+def stream_questions(text, difficulty, num, q_type, client=None, topic=None, use_cache=None,
+                     fresh=False, doc_hash=None, variant=0, cancel=None):
+    """Yield the questions of one batch as soon as each is complete.
+
+    With ``use_cache`` (default ``LLM_CACHE_ENABLED``) the response is looked
+    up on disk by document, text slice, settings and ``variant`` first;
+    ``fresh=True`` skips the lookup but still stores the new response.
+    Only complete, uncancelled responses are written to the cache.
+
+    The model output is streamed through ``StreamingQuestionParser``;
+    setting the ``cancel`` event stops reading the stream after the current
+    chunk. A failure is retried only if it happens before any question was
+    yielded, and exceptions propagate once retries are exhausted.
+    """
+    if not text.strip():
+        raise ValueError("PDF is empty.")
+    client = client or GeminiClient()
+    cache, key = _cache_slot(client, use_cache, doc_hash, text, difficulty, q_type, num, topic, variant)
+    if cache is not None and not fresh:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.incr("llm_cache_hits")
+            parser = StreamingQuestionParser(q_type)
+            yield from parser.feed(cached.decode("utf-8")) + parser.close()
+            return
+    prompt = build_prompt(text, difficulty, num, q_type, topic)
+    metrics.observe("llm_prompt_chars", len(prompt))
+    for attempt in range(MAX_RETRIES + 1):
+        parser = StreamingQuestionParser(q_type)
+        chunks = []
+        emitted = 0
+        # Parse time is measured on its own; the rest of the stream is model latency.
+        started = time.perf_counter()
+        parse_seconds = 0.0
+        try:
+            for chunk in client.generate_stream(prompt):
+                if not chunks:
+                    metrics.observe_time("llm_first_chunk", time.perf_counter() - started)
+                chunks.append(chunk)
+                parse_started = time.perf_counter()
+                parsed = parser.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_started
+                for question in parsed:
+                    emitted += 1
+                    yield question
+                if cancel is not None and cancel.is_set():
+                    return
+            if not chunks:
+                raise ValueError("AI returned empty response.")
+            tail = parser.close()
+            emitted += len(tail)
+            yield from tail
+            metrics.observe_time("llm_call", time.perf_counter() - started, model=client.model_name, attempt=attempt)
+            metrics.observe_time("parse", parse_seconds)
+            metrics.observe("parse_yield", emitted / num if num else 0.0, requested=num, parsed=emitted)
+            break
+        except Exception:
+            metrics.incr("llm_errors")
+            if emitted or attempt == MAX_RETRIES:
+                raise
+            _backoff(attempt)
+    if cache is not None:
+        cache.set(key, "".join(chunks).encode("utf-8"))
+
+
+# --- WHOLE EXAM ---
+def generate_quiz(text, difficulty, num_q, q_type, client=None, batch_size=BATCH_SIZE,
+                  max_concurrency=MAX_CONCURRENCY, on_progress=None, topic=None,
+                  context_chars=CONTEXT_CHARS, use_cache=None, fresh=False,
+                  dedup_threshold=DEDUP_THRESHOLD, resume=None, on_checkpoint=None, stop=None):
+    """Generate ``num_q`` unique questions with concurrent streaming batches.
+
+    The document is chunked and indexed once, and every batch is sent a
+    different ``context_chars`` slice of it, steered towards ``topic`` when
+    one is given. ``use_cache`` and ``fresh`` are passed on to
+    ``stream_questions``; regenerating with the same settings replays the
+    same sequence of requests and so hits the response cache.
+
+    Up to ``max_concurrency`` batches stream at once and every question is
+    merged as soon as it is parsed, skipping near-duplicates of questions
+    already accepted (``dedup_threshold``). Further batches are only
+    requested for the shortfall, enlarged by the yield observed so far so
+    that malformed and duplicate questions are made up in fewer rounds, and
+    batches still streaming when the exam is full are cancelled.
+    ``on_progress(done, total)`` is called from the calling thread after
+    every accepted question. Returns ``(questions, errors)``; generation
+    stops issuing new batches after the first batch that still fails once
+    its retries are exhausted.
+
+    ``on_checkpoint(state)`` receives a JSON-serialisable state after every
+    accepted question; passing it back as ``resume`` continues generation
+    from there, with new batches drawing on document slices not used yet.
+    Setting the ``stop`` event returns the questions accepted so far.
+
+    ``text`` may also be an iterable of page texts, such as
+    ``pdf_extract.stream_pdf_pages``; it is then chunked as it is read and
+    the whole document is never held as one string.
+    """
+    if isinstance(text, str):
+        if not text.strip():
+            return [], ["ERROR: PDF is empty."]
+        with metrics.timer("text_index"):
+            index = build_index(text)
+        doc_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    else:
+        with metrics.timer("text_index"):
+            index = BM25Index(chunk_pages(text))
+        if not any(chunk.strip() for chunk in index.chunks):
+            return [], ["ERROR: PDF is empty."]
+        # Equal to the hash of the joined text, so both inputs share cached responses.
+        doc_hash = document_hash(index.chunks)
+    client = client or GeminiClient()
+    planner = index.planner(topic, context_chars)
+    final_quiz = []
+    seen_questions = NearDuplicateIndex(threshold=dedup_threshold)
+    errors = []
+    requested = accepted = 0
+    calls = 0
+    if resume:
+        for item in resume["questions"]:
+            if seen_questions.add(item['question']):
+                final_quiz.append(item)
+        # Batch ids pick the slice and the cache variant, so resumed batches never repeat one.
+        calls = resume["batches"]
+        for _ in range(calls):
+            planner.next_slice()
+    # Parsers drop malformed questions, so allow some extra rounds, but never loop forever.
+    max_calls = calls + 3 * -(-(num_q - len(final_quiz)) // batch_size) + 2
+    # batch id -> [questions requested, questions expected to survive, questions accepted so far]
+    pending = {}
+    events = queue.Queue()
+    cancel = threading.Event()
+
+    def run_batch(batch_id, slice_text, current_batch):
+        try:
+            for item in stream_questions(
+                slice_text, difficulty, current_batch, q_type, client, topic, use_cache=use_cache,
+                fresh=fresh, doc_hash=doc_hash, variant=batch_id, cancel=cancel,
+            ):
+                events.put(("question", batch_id, item))
+            events.put(("done", batch_id, None))
+        except Exception as e:
+            events.put(("done", batch_id, f"ERROR: {str(e)}"))
+
+    pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="question-gen")
+    try:
+        while len(final_quiz) < num_q:
+            while len(pending) < max_concurrency and calls < max_calls and not errors:
+                # Share of requested questions that survive parsing and dedup so far.
+                expected_yield = max(accepted / requested, MIN_EXPECTED_YIELD) if requested else 1.0
+                in_flight = sum(max(expected - got, 0) for _, expected, got in pending.values())
+                missing = num_q - len(final_quiz) - in_flight
+                if missing <= 0:
+                    break
+                current_batch = min(batch_size, math.ceil(missing / expected_yield))
+                pending[calls] = [current_batch, current_batch * expected_yield, 0]
+                pool.submit(run_batch, calls, planner.next_slice(), current_batch)
+                calls += 1
+            if not pending or (stop is not None and stop.is_set()):
+                break
+            try:
+                kind, batch_id, payload = events.get(timeout=None if stop is None else 0.5)
+            except queue.Empty:
+                continue
+            if kind == "question":
+                if seen_questions.add(payload['question']):
+                    final_quiz.append(payload)
+                    pending[batch_id][2] += 1
+                    accepted += 1
+                    if on_progress:
+                        on_progress(len(final_quiz), num_q)
+                    if on_checkpoint:
+                        on_checkpoint({"questions": list(final_quiz), "batches": calls})
+                else:
+                    metrics.incr("dedup_rejected")
+            else:
+                current_batch = pending.pop(batch_id)[0]
+                if payload:
+                    errors.append(payload)
+                else:
+                    requested += current_batch
+    finally:
+        # Batches still streaming once the exam is full stop at their next chunk.
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return final_quiz, errors
@@ -0,0 +1,66 @@
+"""Parsing of raw LLM output into question dicts.
+
+``StreamingQuestionParser`` consumes model output incrementally and emits
+each question as soon as its ``Answer:`` line arrives, so callers can act
+on questions while the rest of a batch is still streaming in.
+"""
+import re
+
+import metrics
+
+# Improved regex to catch Q:, 1., Question: etc.
+QUESTION_RE = re.compile(r'^(?:Q|Question|\d+)\s*[:\).]', re.IGNORECASE)
+# Match Options A) B) C) D) or A. B. C. D.
+OPTION_RE = re.compile(r'^[A-D][\)\.\s]', re.IGNORECASE)
+ANSWER_RE = re.compile(r'(Answer|CORRECT):', re.IGNORECASE)
+
+
+class StreamingQuestionParser:
+    def __init__(self, q_type):
+        self.q_type = q_type
+        self._partial = ""
+        self._reset()
+
+    def _reset(self):
+        self._q_text = ""
+        self._opts = []
+
+    def feed(self, chunk):
+        """Consume a piece of model output; return the questions it completed."""
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        return [q for q in map(self._parse_line, lines) if q]
+
+    def close(self):
+        """Flush the final, unterminated line once the stream has ended."""
+        line, self._partial = self._partial, ""
+        question = self._parse_line(line)
+        return [question] if question else []
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        if QUESTION_RE.match(line):
+            self._q_text = QUESTION_RE.sub('', line, count=1).strip()
+            self._opts = []
+        elif OPTION_RE.match(line):
+            self._opts.append(line)
+        elif ANSWER_RE.search(line):
+            ans = line.split(":")[-1].strip().upper()
+            opts = self._opts
+            if not opts and self.q_type == "True/False":
+                opts = ["True", "False"]
+            question = None
+            # Validation: Only add if we have a question and at least 2 options (or T/F)
+            if self._q_text and len(opts) >= 2:
+                question = {"question": self._q_text, "options": opts, "answer": ans}
+            self._reset()
+            return question
+        return None
+
+
+def parse_generated_questions(raw_text, q_type):
+    with metrics.timer("parse"):
+        parser = StreamingQuestionParser(q_type)
+        return parser.feed(raw_text) + parser.close()
@@ -0,0 +1,80 @@
+"""Read-only snapshots of the legacy single-exam JSON file.
+
+The app now keeps its exams in ``storage``; a file in this format (a bare
+exam, or one wrapped with a version and publish time) is imported from
+there once by ``ExamStore.migrate_json``. Readers share one immutable
+snapshot per process and only re-read the file when a ``stat`` shows it
+changed. The frozen snapshot helpers are shared with ``storage``.
+"""
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QuizSnapshot = namedtuple("QuizSnapshot", ["version", "published_at", "exam"])
+EMPTY_SNAPSHOT = QuizSnapshot(0, None, ())
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def freeze(value):
+    """Read-only copy of decoded JSON, safe to share between sessions."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Plain ``dict``/``list`` copy of a frozen value, e.g. for JSON encoding."""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # A publish renames a new file into place, which always changes the inode.
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read(path):
+    with open(path, "r") as f:
+        payload = json.load(f)
+    if isinstance(payload, dict) and "version" in payload and "exam" in payload:
+        return QuizSnapshot(payload["version"], payload.get("published_at"), freeze(payload["exam"]))
+    # Files written before versioning hold the bare exam.
+    return QuizSnapshot(0, None, freeze(payload))
+
+
+def load_snapshot(path):
+    """Return the current snapshot, re-reading ``path`` only if it changed."""
+    signature = _signature(path)
+    with _lock:
+        cached = _snapshots.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        if signature is None:
+            snapshot = EMPTY_SNAPSHOT
+        else:
+            try:
+                with metrics.timer("quiz_load"):
+                    snapshot = _read(path)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read published exam %s: %s", path, e)
+                return cached[1] if cached else EMPTY_SNAPSHOT
+        _snapshots[path] = (signature, snapshot)
+        return snapshot
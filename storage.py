@@ -0,0 +1,499 @@
+"""Pluggable storage for published exams, shared between replicas.
+
+Exams are keyed by an exam id. Every publish adds a new, immutable
+version; nothing that was published is rewritten. Two backends implement
+the same small interface (``publish``, ``load``, ``versions``,
+``exam_ids``, ``delete``, ``listener``):
+
+- ``SQLiteBackend`` keeps everything in one database file that every
+  process and replica on the host (or shared volume) opens. Publishes are
+  logged in an event table, and a listener notices new events through
+  ``PRAGMA data_version``, which changes only when another connection
+  commits. Checking for news costs one query, and no file is read.
+- ``RedisBackend`` works with any client that has the redis-py interface
+  and announces publishes on a pub/sub channel. ``LocalRedis`` is an
+  in-process stand-in with that interface, for development and
+  single-process runs; ``redis://`` URLs use the ``redis`` package.
+
+``ExamStore`` sits in front of a backend and keeps one frozen snapshot per
+exam in memory. It drops a snapshot only when a change notification names
+that exam, so a replica re-reads an exam once per publish.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+import metrics
+from quiz_store import EMPTY_SNAPSHOT, QuizSnapshot, freeze, load_snapshot, thaw
+
+logger = logging.getLogger(__name__)
+
+# ``sqlite:///path``, a plain path, ``redis://host:port/db`` or ``local://``.
+STORAGE_URL = os.getenv("BODHA_STORAGE_URL", "")
+DEFAULT_EXAM = "default"
+# Events kept in the SQLite log; a listener further behind reloads every exam.
+EVENT_LOG_SIZE = 1000
+
+_EXAM_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exam_versions (
+    exam_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    published_at TEXT NOT NULL,
+    exam TEXT NOT NULL,
+    PRIMARY KEY (exam_id, version)
+);
+CREATE TRIGGER IF NOT EXISTS exam_versions_immutable BEFORE UPDATE ON exam_versions
+BEGIN
+    SELECT RAISE(ABORT, 'published exam versions are immutable');
+END;
+CREATE TABLE IF NOT EXISTS exam_counters (
+    exam_id TEXT PRIMARY KEY,
+    last_version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exam_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    exam_id TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def check_exam_id(exam_id):
+    """Return ``exam_id`` if it is a valid id, else raise ``ValueError``."""
+    if not isinstance(exam_id, str) or not _EXAM_ID_RE.match(exam_id):
+        raise ValueError(
+            f"Invalid exam id {exam_id!r}: use up to 64 letters, digits, '.', '_' or '-', starting with a letter or digit."
+        )
+    return exam_id
+
+
+# --- SQLITE ---
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def publish(self, exam_id, exam_json, published_at):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # The counter outlives ``delete``, so a version number is never handed out twice;
+                # databases created before it existed start from their highest stored version.
+                self._conn.execute(
+                    "INSERT INTO exam_counters (exam_id, last_version) "
+                    "SELECT ?, COALESCE(MAX(version), 0) + 1 FROM exam_versions WHERE exam_id = ? "
+                    "ON CONFLICT (exam_id) DO UPDATE SET last_version = last_version + 1",
+                    (exam_id, exam_id),
+                )
+                (version,) = self._conn.execute(
+                    "SELECT last_version FROM exam_counters WHERE exam_id = ?", (exam_id,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT INTO exam_versions (exam_id, version, published_at, exam) VALUES (?, ?, ?, ?)",
+                    (exam_id, version, published_at, exam_json),
+                )
+                self._log_event(exam_id, version)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return version
+
+    def _log_event(self, exam_id, version):
+        seq = self._conn.execute(
+            "INSERT INTO exam_events (exam_id, version) VALUES (?, ?)", (exam_id, version)
+        ).lastrowid
+        self._conn.execute("DELETE FROM exam_events WHERE seq <= ?", (seq - EVENT_LOG_SIZE,))
+
+    def load(self, exam_id, version=None):
+        """``(version, published_at, exam_json)`` of a version (default the latest), or ``None``."""
+        with self._lock:
+            if version is None:
+                return self._conn.execute(
+                    "SELECT version, published_at, exam FROM exam_versions WHERE exam_id = ? "
+                    "ORDER BY version DESC LIMIT 1",
+                    (exam_id,),
+                ).fetchone()
+            return self._conn.execute(
+                "SELECT version, published_at, exam FROM exam_versions WHERE exam_id = ? AND version = ?",
+                (exam_id, version),
+            ).fetchone()
+
+    def versions(self, exam_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT version, published_at FROM exam_versions WHERE exam_id = ? ORDER BY version", (exam_id,)
+            ).fetchall()
+
+    def exam_ids(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT exam_id FROM exam_versions ORDER BY exam_id")]
+
+    def delete(self, exam_id):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM exam_versions WHERE exam_id = ?", (exam_id,))
+                self._log_event(exam_id, 0)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def listener(self):
+        return _SQLiteListener(self._connect())
+
+
+class _SQLiteListener:
+    """Reports ``(exam_id, version)`` events committed since the last poll.
+
+    Uses its own connection: ``data_version`` only moves for commits made by
+    other connections, which then includes every publisher.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._data_version = self._read_data_version()
+        self._last_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM exam_events").fetchone()[0]
+
+    def _read_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll(self):
+        """New events; ``(None, None)`` means events were missed and everything may have changed."""
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            first = self._conn.execute("SELECT MIN(seq) FROM exam_events").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, exam_id, version FROM exam_events WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+            missed = first is not None and first > self._last_seq + 1
+            if rows:
+                self._last_seq = rows[-1][0]
+        events = [(exam_id, version) for _, exam_id, version in rows]
+        return [(None, None)] + events if missed else events
+
+
+# --- REDIS ---
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class RedisBackend:
+    """Exams in Redis: ``<prefix>:exam:<id>:v<n>`` holds each version.
+
+    ``<prefix>:exam:<id>:latest`` is an ``INCR`` counter handing out version
+    numbers and ``<prefix>:exams`` the set of exam ids. A version key is
+    written with ``NX``, so it can never be overwritten, and ``delete``
+    keeps the counter so numbers are not reused after a clear.
+    """
+
+    def __init__(self, client, prefix="bodha"):
+        self.client = client
+        self.prefix = prefix
+        self.channel = f"{prefix}:exam-published"
+
+    def _key(self, exam_id, suffix):
+        return f"{self.prefix}:exam:{exam_id}:{suffix}"
+
+    def publish(self, exam_id, exam_json, published_at):
+        version = self.client.incr(self._key(exam_id, "latest"))
+        value = json.dumps({"published_at": published_at, "exam": exam_json})
+        if not self.client.set(self._key(exam_id, f"v{version}"), value, nx=True):
+            raise RuntimeError(f"Exam {exam_id} version {version} already exists.")
+        self.client.sadd(f"{self.prefix}:exams", exam_id)
+        self.client.publish(self.channel, json.dumps([exam_id, version]))
+        return version
+
+    def load(self, exam_id, version=None):
+        if version is None:
+            latest = self.client.get(self._key(exam_id, "latest"))
+            # A publisher may have taken a number without writing its version yet.
+            candidates = range(int(latest), 0, -1) if latest else ()
+        else:
+            candidates = (version,)
+        for candidate in candidates:
+            value = self.client.get(self._key(exam_id, f"v{candidate}"))
+            if value is not None:
+                payload = json.loads(value)
+                return candidate, payload["published_at"], payload["exam"]
+        return None
+
+    def versions(self, exam_id):
+        latest = self.client.get(self._key(exam_id, "latest"))
+        if not latest:
+            return []
+        numbers = range(1, int(latest) + 1)
+        values = self.client.mget([self._key(exam_id, f"v{n}") for n in numbers])
+        return [(n, json.loads(v)["published_at"]) for n, v in zip(numbers, values) if v is not None]
+
+    def exam_ids(self):
+        return sorted(_text(member) for member in self.client.smembers(f"{self.prefix}:exams"))
+
+    def delete(self, exam_id):
+        latest = self.client.get(self._key(exam_id, "latest"))
+        keys = [self._key(exam_id, f"v{n}") for n in range(1, int(latest or 0) + 1)]
+        if keys:
+            self.client.delete(*keys)
+        self.client.srem(f"{self.prefix}:exams", exam_id)
+        self.client.publish(self.channel, json.dumps([exam_id, 0]))
+
+    def listener(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        return _RedisListener(pubsub)
+
+
+class _RedisListener:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+        self._lock = threading.Lock()
+
+    def poll(self):
+        events = []
+        with self._lock:
+            while True:
+                message = self._pubsub.get_message(timeout=0)
+                if message is None:
+                    break
+                if message.get("type") == "message":
+                    exam_id, version = json.loads(_text(message["data"]))
+                    events.append((exam_id, version))
+        return events
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of the redis-py client used here.
+
+    Values come back as ``bytes`` like a client without
+    ``decode_responses``. State lives in this object, so it is only shared
+    by the sessions of one process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._sets = defaultdict(set)
+        self._subscribers = defaultdict(list)
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name)
+
+    def mget(self, names):
+        with self._lock:
+            return [self._values.get(name) for name in names]
+
+    def set(self, name, value, nx=False):
+        with self._lock:
+            if nx and name in self._values:
+                return None
+            self._values[name] = self._bytes(value)
+            return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._values.get(name, b"0")) + amount
+            self._values[name] = self._bytes(value)
+            return value
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(
+                (self._values.pop(name, None) is not None) + (self._sets.pop(name, None) is not None) for name in names
+            )
+
+    def sadd(self, name, *values):
+        with self._lock:
+            members = self._sets[name]
+            before = len(members)
+            members.update(self._bytes(v) for v in values)
+            return len(members) - before
+
+    def srem(self, name, *values):
+        with self._lock:
+            members = self._sets[name]
+            before = len(members)
+            members.difference_update(self._bytes(v) for v in values)
+            return before - len(members)
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._sets.get(name, ()))
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub._deliver(channel, self._bytes(message))
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _LocalPubSub(self, ignore_subscribe_messages)
+
+
+class _LocalPubSub:
+    def __init__(self, redis, ignore_subscribe_messages):
+        self._redis = redis
+        self._ignore_subscribe_messages = ignore_subscribe_messages
+        self._messages = deque()
+        self._channels = []
+
+    def subscribe(self, *channels):
+        with self._redis._lock:
+            for channel in channels:
+                self._redis._subscribers[channel].append(self)
+                self._channels.append(channel)
+        if not self._ignore_subscribe_messages:
+            for i, channel in enumerate(channels, start=1):
+                self._messages.append({"type": "subscribe", "channel": self._bytes(channel), "data": i})
+
+    def _bytes(self, value):
+        return self._redis._bytes(value)
+
+    def _deliver(self, channel, data):
+        self._messages.append({"type": "message", "channel": self._bytes(channel), "data": data})
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return self._messages.popleft()
+        except IndexError:
+            return None
+
+    def close(self):
+        with self._redis._lock:
+            for channel in self._channels:
+                self._redis._subscribers[channel].remove(self)
+        self._channels = []
+
+
+def open_backend(url):
+    """Backend for a storage URL (see ``STORAGE_URL``)."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+
+        return RedisBackend(redis.Redis.from_url(url))
+    if url.startswith("local://"):
+        return RedisBackend(LocalRedis())
+    return SQLiteBackend(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url)
+
+
+# --- CACHED FRONT END ---
+class ExamStore:
+    """Exams by id, with one cached snapshot per exam and process.
+
+    Reads poll the backend's change listener (a single query or a drained
+    pub/sub buffer) and only reload an exam that a notification named.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._listener = backend.listener()
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def _apply_changes(self):
+        for exam_id, _ in self._listener.poll():
+            if exam_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(exam_id, None)
+
+    @staticmethod
+    def _snapshot(row):
+        if row is None:
+            return EMPTY_SNAPSHOT
+        version, published_at, exam_json = row
+        return QuizSnapshot(version, published_at, freeze(json.loads(exam_json)))
+
+    def snapshot(self, exam_id=DEFAULT_EXAM):
+        """The latest published version of ``exam_id`` (``EMPTY_SNAPSHOT`` if none)."""
+        with self._lock:
+            self._apply_changes()
+            snapshot = self._snapshots.get(exam_id)
+            if snapshot is None:
+                with metrics.timer("quiz_load"):
+                    snapshot = self._snapshot(self.backend.load(exam_id))
+                self._snapshots[exam_id] = snapshot
+            return snapshot
+
+    def version(self, exam_id, version):
+        """A specific published version; versions never change, so no cache is involved."""
+        return self._snapshot(self.backend.load(exam_id, version))
+
+    @metrics.timed("quiz_publish")
+    def publish(self, exam_id, exam):
+        """Publish ``exam`` as the next version of ``exam_id``; return that version."""
+        check_exam_id(exam_id)
+        version = self.backend.publish(exam_id, json.dumps(thaw(exam)), time.strftime("%Y-%m-%d %H:%M:%S"))
+        with self._lock:
+            self._snapshots.pop(exam_id, None)
+        return version
+
+    def versions(self, exam_id):
+        """``(version, published_at)`` of every published version, oldest first."""
+        return self.backend.versions(exam_id)
+
+    def exam_ids(self):
+        return self.backend.exam_ids()
+
+    def delete(self, exam_id):
+        self.backend.delete(exam_id)
+        with self._lock:
+            self._snapshots.pop(exam_id, None)
+
+    def clear(self):
+        for exam_id in self.exam_ids():
+            self.delete(exam_id)
+
+    def migrate_json(self, json_path, exam_id=DEFAULT_EXAM):
+        """Publish a legacy single-exam JSON file as ``exam_id`` once.
+
+        Nothing is imported when ``exam_id`` already has versions. The file
+        is renamed to ``<name>.migrating`` while it is imported and to
+        ``<name>.migrated`` afterwards; a file left claimed by a crash is
+        picked up again on the next start. Returns the version published,
+        or ``None``.
+        """
+        claimed = json_path + ".migrating"
+        try:
+            # Renaming first means only one replica normally imports the file.
+            os.replace(json_path, claimed)
+        except FileNotFoundError:
+            if not os.path.exists(claimed):
+                return None
+        snapshot = load_snapshot(claimed)
+        version = None
+        if snapshot.exam and not self.backend.versions(exam_id):
+            version = self.publish(exam_id, snapshot.exam)
+            logger.info("Migrated %s into exam %r as version %s", json_path, exam_id, version)
+        try:
+            os.replace(claimed, json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+        return version
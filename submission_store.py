@@ -0,0 +1,355 @@
+"""Append-only store for student submissions.
+
+Submissions live in an SQLite table in WAL mode so that concurrent
+students never rewrite each other's rows. Writes from every session in the
+process are funnelled through one writer thread which commits bursts of
+submissions together (group commit), and readers only fetch rows they have
+not seen yet.
+
+Alongside the score, each row keeps the student's raw answers as compact
+vectors (see ``grading``), so results can be re-graded after a key fix,
+and the id and version of the exam it answers. Every read can be limited
+to one exam; ``exam_id=None`` reads all of them.
+The same database keeps per-student answer checkpoints for exams in
+progress, so a student can resume after a refresh or crash.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+from storage import DEFAULT_EXAM
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    submitted_at TEXT NOT NULL,
+    question_ids BLOB,
+    answers BLOB,
+    exam_id TEXT NOT NULL DEFAULT '{DEFAULT_EXAM}',
+    exam_version INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    exam_key TEXT NOT NULL,
+    student_key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (exam_key, student_key)
+);
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def student_key(name):
+    return " ".join(name.lower().split())
+
+
+def format_result(row):
+    """Render a stored row in the shape the dashboard and reports expect."""
+    _, name, score, total, submitted_at, exam_version = row[:6]
+    pct = (score / total) * 100 if total else 0.0
+    return {
+        "Student Name": name,
+        "Score": f"{score}/{total}",
+        "Percentage": f"{pct:.1f}%",
+        "Exam Version": exam_version if exam_version is not None else "-",
+        "Timestamp": submitted_at,
+    }
+
+
+def _exam_filter(exam_id, column="exam_id"):
+    """``(sql, params)`` narrowing a ``WHERE`` clause to one exam; empty for ``None``."""
+    if exam_id is None:
+        return "", ()
+    return f" AND {column} = ?", (exam_id,)
+
+
+class _PendingWrite:
+    __slots__ = ("row", "done", "row_id", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.row_id = None
+        self.error = None
+
+
+class SubmissionStore:
+    """Process-wide handle on the submissions database.
+
+    ``append`` blocks until its row is durable, but rows queued while a
+    commit is in flight are written together in the next transaction, so a
+    burst of N submissions costs a handful of commits rather than N.
+    """
+
+    def __init__(self, path, commit_window=0.005, max_batch=256):
+        self.path = path
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._read_conn = connect(path)
+        self._read_conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._read_conn.execute("PRAGMA table_info(submissions)")]
+        for column in ("question_ids", "answers"):
+            if column not in columns:
+                self._read_conn.execute(f"ALTER TABLE submissions ADD COLUMN {column} BLOB")
+        # Rows from before exams had ids all answered the single default exam.
+        if "exam_id" not in columns:
+            self._read_conn.execute(
+                f"ALTER TABLE submissions ADD COLUMN exam_id TEXT NOT NULL DEFAULT '{DEFAULT_EXAM}'"
+            )
+        if "exam_version" not in columns:
+            self._read_conn.execute("ALTER TABLE submissions ADD COLUMN exam_version INTEGER")
+        self._read_conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_exam ON submissions (exam_id, id)")
+        # exam_id (None for every exam) -> [last row id read, formatted rows]
+        self._caches = {}
+        self._generation = None
+        self._writer = threading.Thread(target=self._write_loop, name="submission-writer", daemon=True)
+        self._writer.start()
+
+    # --- WRITES ---
+    def append(self, name, score, total, submitted_at=None, question_ids=None, answers=None,
+               exam_id=DEFAULT_EXAM, exam_version=None):
+        """Durably record one submission and return its row id.
+
+        ``question_ids`` and ``answers`` are the packed vectors produced by
+        ``grading.pack``; ``exam_id`` and ``exam_version`` name the published
+        exam the student answered.
+        """
+        submitted_at = submitted_at or time.strftime("%Y-%m-%d %H:%M:%S")
+        pending = _PendingWrite(
+            (name, int(score), int(total), submitted_at, question_ids, answers, exam_id, exam_version)
+        )
+        with metrics.timer("submission_write"):
+            self._queue.put(pending)
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.row_id
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.commit_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for pending in batch:
+                    cur = conn.execute(
+                        "INSERT INTO submissions "
+                        "(student_name, score, total, submitted_at, question_ids, answers, exam_id, exam_version) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        pending.row,
+                    )
+                    pending.row_id = cur.lastrowid
+                conn.execute("COMMIT")
+                metrics.observe("submission_commit_batch", len(batch))
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+    def clear(self):
+        with self._read_lock:
+            self._read_conn.execute("BEGIN IMMEDIATE")
+            self._read_conn.execute("DELETE FROM submissions")
+            self._read_conn.execute("DELETE FROM checkpoints")
+            self._read_conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            self._read_conn.execute("COMMIT")
+
+    def answer_vectors(self, exam_id=None):
+        """``(row_id, score, question_ids, answers)`` for every submission with stored answers."""
+        where, params = _exam_filter(exam_id)
+        with self._read_lock:
+            return self._read_conn.execute(
+                f"SELECT id, score, question_ids, answers FROM submissions WHERE answers IS NOT NULL{where} ORDER BY id",
+                params,
+            ).fetchall()
+
+    def submission_rows(self, after_id=0, exam_id=None):
+        """``(row_id, score, total, question_ids, answers)`` for submissions after ``after_id``."""
+        where, params = _exam_filter(exam_id)
+        with self._read_lock:
+            return self._read_conn.execute(
+                f"SELECT id, score, total, question_ids, answers FROM submissions WHERE id > ?{where} ORDER BY id",
+                (after_id, *params),
+            ).fetchall()
+
+    def iter_submissions(self, batch_size=1000, exam_id=None):
+        """Yield every submission (of ``exam_id``) as a row tuple.
+
+        Each row is ``(row_id, name, score, total, submitted_at,
+        question_ids, answers, exam_id, exam_version)``. Rows are read in
+        keyset-paged batches, so exports of any size hold only one batch in
+        memory and never keep the database locked.
+        """
+        where, params = _exam_filter(exam_id)
+        last_id = 0
+        while True:
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    "SELECT id, student_name, score, total, submitted_at, question_ids, answers, exam_id, exam_version "
+                    f"FROM submissions WHERE id > ?{where} ORDER BY id LIMIT ?",
+                    (last_id, *params, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def version(self, exam_id=None):
+        """Token that changes whenever the set of submissions (of ``exam_id``) or their scores changes.
+
+        The last element is the number of submissions.
+        """
+        where, params = _exam_filter(exam_id)
+        with self._read_lock:
+            max_id, count = self._read_conn.execute(
+                f"SELECT MAX(id), COUNT(*) FROM submissions WHERE 1{where}", params
+            ).fetchone()
+            return (self._generation_locked(), max_id or 0, count)
+
+    def generation(self):
+        """Counter bumped whenever existing rows change, invalidating incremental readers."""
+        with self._read_lock:
+            return self._generation_locked()
+
+    def _generation_locked(self):
+        return self._read_conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def update_scores(self, scores):
+        """Apply ``(row_id, score)`` pairs in one transaction, e.g. after a re-grade."""
+        with self._read_lock:
+            self._read_conn.execute("BEGIN IMMEDIATE")
+            self._read_conn.executemany("UPDATE submissions SET score = ? WHERE id = ?", [(s, i) for i, s in scores])
+            # Changing existing rows invalidates every reader's incremental cache.
+            self._read_conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            self._read_conn.execute("COMMIT")
+
+    # --- CHECKPOINTS ---
+    def save_checkpoint(self, exam_key, name, state):
+        """Store the in-progress ``state`` (any JSON value) of a student's exam."""
+        with self._read_lock:
+            self._read_conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (exam_key, student_key, state, updated_at) VALUES (?, ?, ?, ?)",
+                (exam_key, student_key(name), json.dumps(state), time.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+
+    def load_checkpoint(self, exam_key, name):
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT state FROM checkpoints WHERE exam_key = ? AND student_key = ?",
+                (exam_key, student_key(name)),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_checkpoint(self, exam_key, name):
+        with self._read_lock:
+            self._read_conn.execute(
+                "DELETE FROM checkpoints WHERE exam_key = ? AND student_key = ?", (exam_key, student_key(name))
+            )
+
+    # --- READS ---
+    def results(self, exam_id=None):
+        """Return every submission (of ``exam_id``), fetching only rows added since the last call."""
+        where, params = _exam_filter(exam_id)
+        with self._read_lock:
+            generation = self._generation_locked()
+            if generation != self._generation:
+                self._caches = {}
+                self._generation = generation
+            cache = self._caches.setdefault(exam_id, [0, []])
+            rows = self._read_conn.execute(
+                "SELECT id, student_name, score, total, submitted_at, exam_version "
+                f"FROM submissions WHERE id > ?{where} ORDER BY id",
+                (cache[0], *params),
+            ).fetchall()
+            if rows:
+                cache[1].extend(format_result(r) for r in rows)
+                cache[0] = rows[-1][0]
+            return list(cache[1])
+
+    # --- MIGRATION ---
+    def migrate_json(self, json_path):
+        """Import a legacy ``student_submissions.json`` file once.
+
+        The file is renamed to ``<name>.migrating`` while it is imported and
+        to ``<name>.migrated`` afterwards. A file left claimed by a crash is
+        picked up again on the next start; a marker committed with the rows
+        keeps it from being imported twice. Returns the number of rows
+        imported.
+        """
+        claimed = json_path + ".migrating"
+        try:
+            # Renaming first means only one process normally imports the file.
+            os.replace(json_path, claimed)
+        except FileNotFoundError:
+            if not os.path.exists(claimed):
+                return 0
+        try:
+            with open(claimed, "r") as f:
+                try:
+                    legacy = json.load(f)
+                except ValueError:
+                    legacy = []
+        except FileNotFoundError:
+            # Another process finished the import meanwhile.
+            return 0
+        rows = []
+        for item in legacy:
+            try:
+                score, total = str(item["Score"]).split("/")
+                rows.append((str(item["Student Name"]), int(score), int(total), str(item.get("Timestamp", ""))))
+            except (KeyError, ValueError):
+                continue
+        marker = "migrated:" + os.path.basename(json_path)
+        with self._read_lock:
+            self._read_conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._read_conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                    rows = []
+                else:
+                    self._read_conn.executemany(
+                        "INSERT INTO submissions (student_name, score, total, submitted_at) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._read_conn.execute("INSERT INTO meta (key, value) VALUES (?, 1)", (marker,))
+                self._read_conn.execute("COMMIT")
+            except BaseException:
+                self._read_conn.execute("ROLLBACK")
+                raise
+        try:
+            os.replace(claimed, json_path + ".migrated")
+        except FileNotFoundError:
+            pass
+        return len(rows)
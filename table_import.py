@@ -0,0 +1,101 @@
+"""Bulk import of question banks laid out as PDF tables.
+
+The expected layout is one row per question with the columns
+``Questions | A | B | C | D | Answer`` and a header row containing
+"Questions" on the first page. Pages are read in parallel worker
+processes; rows that fail validation are reported back instead of
+aborting the import.
+
+Empty option cells are left out of the question (the remaining options
+keep their letters). The answer cell may be a letter such as ``B`` or
+``b)``; a row whose answer does not name one of its non-empty options is
+rejected, since it could never be graded correct.
+"""
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from dedup_index import DEDUP_THRESHOLD, NearDuplicateIndex
+from grading import NO_KEY, answer_label, key_index
+from pdf_extract import PARALLEL_MIN_PAGES, PDF_WORKERS, split_page_ranges
+
+HEADER_MARKER = "Questions"
+OPTION_LETTERS = ("A", "B", "C", "D")
+
+RowError = namedtuple("RowError", ["page", "row", "reason"])
+
+
+def _read_page_range(file_path, start, stop):
+    """Return ``(page_number, row_number, row)`` for every table row in the range."""
+    import pdfplumber
+
+    rows = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_no in range(start, stop):
+            page = pdf.pages[page_no]
+            table_data = page.extract_table()
+            page.close()
+            if not table_data:
+                continue
+            for row_no, row in enumerate(table_data, start=1):
+                rows.append((page_no + 1, row_no, row))
+    return rows
+
+
+def validate_row(row):
+    """Return ``(question, None)`` for a valid row or ``(None, reason)``."""
+    if len(row) < 6:
+        return None, f"expected 6 columns, found {len(row)}"
+    cells = [str(cell).strip() if cell is not None else "" for cell in row[:6]]
+    q_text = cells[0]
+    options = [f"{letter}) {opt}" for letter, opt in zip(OPTION_LETTERS, cells[1:5]) if opt]
+    if not q_text:
+        return None, "question text is empty"
+    if len(options) < 2:
+        return None, "fewer than two options"
+    answer = answer_label(cells[5])
+    if key_index(options, answer) == NO_KEY:
+        return None, f"answer '{cells[5]}' does not name one of the row's options"
+    return {"question": q_text, "options": options, "answer": answer}, None
+
+
+@metrics.timed("table_import")
+def import_table_pdf(file_path, workers=PDF_WORKERS, dedup_threshold=DEDUP_THRESHOLD):
+    """Read every question row from a table-format PDF.
+
+    Returns ``(questions, errors)`` where ``errors`` is a list of
+    ``RowError``. Raises ``ValueError`` when the first page does not carry
+    the "Questions" header.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        num_pages = len(pdf.pages)
+        first_page_table = pdf.pages[0].extract_table() if num_pages else None
+    if not first_page_table or HEADER_MARKER not in str(first_page_table[0]):
+        raise ValueError("Header Validation Failed: First page must contain 'Questions' header.")
+
+    if workers <= 1 or num_pages < PARALLEL_MIN_PAGES:
+        rows = _read_page_range(file_path, 0, num_pages)
+    else:
+        ranges = split_page_ranges(num_pages, workers)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=ctx) as pool:
+            futures = [pool.submit(_read_page_range, file_path, start, stop) for start, stop in ranges]
+            rows = [row for future in futures for row in future.result()]
+
+    questions, errors = [], []
+    seen_questions = NearDuplicateIndex(threshold=dedup_threshold)
+    for page_no, row_no, row in rows:
+        # Header rows (repeated at the top of each page) and blank rows are not errors.
+        if (row_no == 1 and HEADER_MARKER in str(row)) or not any(cell for cell in row):
+            continue
+        question, reason = validate_row(row)
+        if question is None:
+            errors.append(RowError(page_no, row_no, reason))
+        elif not seen_questions.add(question["question"]):
+            errors.append(RowError(page_no, row_no, "duplicate of an earlier question"))
+        else:
+            questions.append(question)
+    return questions, errors
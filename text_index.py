@@ -0,0 +1,134 @@
+"""Chunking and BM25 retrieval over extracted document text.
+
+Instead of sending the opening pages of a document with every request,
+generation asks a ``SlicePlanner`` for the next slice of the text. Slices
+walk through the whole document, or through the chunks most relevant to a
+topic keyword when one is given, so concurrent batches see different
+material.
+"""
+import functools
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+
+CHUNK_CHARS = 1500
+CONTEXT_CHARS = 6000
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS):
+    """Split text into chunks of roughly ``chunk_chars``, breaking on lines."""
+    return chunk_pages([text], chunk_chars)
+
+
+def chunk_pages(pages, chunk_chars=CHUNK_CHARS):
+    """Chunk an iterable of texts, e.g. a page stream, as it is read.
+
+    The chunks are the ones ``chunk_text`` would produce for the texts
+    joined with newlines, but that joined text is never built.
+    """
+    chunks, current, size = [], [], 0
+    for page in pages:
+        for line in page.split("\n"):
+            if size and size + len(line) > chunk_chars:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+    if current and size:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def document_hash(chunks):
+    """SHA-256 of the chunks joined with newlines, i.e. of the chunked text."""
+    h = hashlib.sha256()
+    for i, chunk in enumerate(chunks):
+        if i:
+            h.update(b"\n")
+        h.update(chunk.encode("utf-8"))
+    return h.hexdigest()
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, query, k=None):
+        """Return chunk indices ranked by BM25 score, best first."""
+        n = len(self.chunks)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))
+        return ranked[:k] if k else ranked
+
+    def planner(self, topic=None, context_chars=CONTEXT_CHARS):
+        return SlicePlanner(self, topic, context_chars)
+
+
+class SlicePlanner:
+    """Hands out a different slice of the document for every batch.
+
+    Without a topic, slices are consecutive runs of chunks covering the
+    whole document. With a topic, they are drawn from the matching chunks
+    in order of relevance. Once every slice has been used the planner
+    starts over.
+    """
+
+    def __init__(self, index, topic=None, context_chars=CONTEXT_CHARS):
+        order = index.search(topic) if topic and topic.strip() else []
+        if not order:
+            order = list(range(len(index.chunks)))
+        self.slices = []
+        current, size = [], 0
+        for i in order:
+            chunk = index.chunks[i]
+            if current and size + len(chunk) > context_chars:
+                self.slices.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += len(chunk)
+        if current:
+            self.slices.append(current)
+        self.index = index
+        self._next = 0
+
+    def next_slice(self):
+        if not self.slices:
+            return ""
+        ids = self.slices[self._next % len(self.slices)]
+        self._next += 1
+        # Relevance order picks the chunks; document order keeps them readable.
+        return "\n".join(self.index.chunks[i] for i in sorted(ids))
+
+
+@functools.lru_cache(maxsize=8)
+def build_index(text, chunk_chars=CHUNK_CHARS):
+    """Chunk and index a document once; repeated calls reuse the result."""
+    return BM25Index(chunk_text(text, chunk_chars))